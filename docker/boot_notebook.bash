@@ -12,18 +12,49 @@ echo "$INFO" "creating inputs/outputs folder"
 mkdir --parents "${INPUTS_FOLDER}"
 mkdir --parents "${OUTPUTS_FOLDER}"
 
-# Restore previous state pulling it from S3
-if [ -n "${SIMCORE_NODE_BASEPATH}" ]; then
-  echo "$INFO" "Restoring previous state..."
-  python /docker/state_puller.py "${SIMCORE_NODE_APP_STATE_PATH}"
-else
-  echo "$WARNING" "SIMCORE_NODE_APP_STATE_PATH was not set. Saving states feature is disabled."
-fi
+# jupyter_commons is installed in the base environment, not in .venv (activated below)
+COMMONS_PYTHON="$(command -v python)"
+
+# Boot phases are timed and recorded, see jupyter_commons.readiness
+phase() {
+  "${COMMONS_PYTHON}" -m jupyter_commons.readiness run "$@"
+}
+
+# Restores the previous state and trusts the notebooks while the notebook server
+# starts. Until this is done, the work folder is not served and the state cannot
+# be pushed.
+restore_state_and_trust() {
+  if [ -n "${SIMCORE_NODE_BASEPATH}" ]; then
+    echo "$INFO" "Restoring previous state..."
+    # notebooks and small files first, the large files are restored once ready
+    if ! phase restore python /docker/state_puller.py --mode=priority "${SIMCORE_NODE_APP_STATE_PATH}"; then
+      # the gate stays closed: what was restored is served, nothing can be saved
+      echo "$WARNING" "the state could not be restored, changes cannot be saved"
+      return 1
+    fi
+  else
+    echo "$WARNING" "SIMCORE_NODE_APP_STATE_PATH was not set. Saving states feature is disabled."
+  fi
 
-# Trust all notebooks in the notebooks folder
-echo "$INFO" "trust all notebooks in path..."
-find "${SIMCORE_NODE_APP_STATE_PATH}" -name '*.ipynb' -type f -exec jupyter trust {} +
+  # Trust all new or modified notebooks in the notebooks folder
+  echo "$INFO" "trust all notebooks in path..."
+  phase trust python -m jupyter_commons.trust "${SIMCORE_NODE_APP_STATE_PATH}" ||
+    echo "$WARNING" "notebooks could not be trusted"
 
+  python -m jupyter_commons.readiness ready
+
+  if [ -n "${SIMCORE_NODE_BASEPATH}" ]; then
+    phase restore_remaining python /docker/state_puller.py --mode=remaining "${SIMCORE_NODE_APP_STATE_PATH}"
+  fi
+
+  # large notebook outputs no notebook refers to anymore
+  phase blobs_gc python -m jupyter_commons.blobs gc "${SIMCORE_NODE_APP_STATE_PATH}" \
+    --checkpoints /home/jovyan/._ipynb_checkpoints/ ||
+    echo "$WARNING" "unused notebook outputs could not be removed"
+}
+
+python -m jupyter_commons.readiness reset
+restore_state_and_trust &
 
 
 # Configure
@@ -50,16 +81,23 @@ cat > .jupyter_config.json <<EOF
         "open_browser": false,
         "webbrowser_open_new": 0,
         "disable_check_xsrf": true,
+        "contents_manager_class": "jupyter_commons.contents.StateContentsManager",
         "nbserver_extensions": {
+            "jupyter_commons.contents": true,
             "jupyter_commons.handlers.retrieve": true,
             "jupyter_commons.handlers.push": true,
             "jupyter_commons.handlers.state": true,
-            "jupyter_commons.handlers.watcher": true
+            "jupyter_commons.handlers.watcher": true,
+            "jupyter_commons.handlers.autosave": true,
+            "jupyter_commons.handlers.health": true
         }
     },
     "FileCheckpoints": {
         "checkpoint_dir": "/home/jovyan/._ipynb_checkpoints/"
     },
+    "NotebookNotary": {
+        "data_dir": "${SIMCORE_NODE_APP_STATE_PATH}/.jupyter_trust"
+    },
     "KernelSpecManager": {
         "ensure_native_kernel": false
     },
@@ -93,14 +131,19 @@ VOILA_NOTEBOOK="${SIMCORE_NODE_APP_STATE_PATH}"/voila.ipynb
 
 if [ "${AS_VOILA-0}" -ne 1 ]; then
     # disable the preview if this is not the voila service
-    jupyter labextension disable  @jupyter-voila/jupyterlab-preview
+    phase labextension jupyter labextension disable  @jupyter-voila/jupyterlab-preview
 else
     echo "$INFO" "Found AS_VOILA=${AS_VOILA}... Starting in voila mode"
+    # voila.ipynb might still be restored
+    "${COMMONS_PYTHON}" -m jupyter_commons.readiness wait
 fi
 
 if [ "${AS_VOILA-0}" -eq 1 ] && [ -f "${VOILA_NOTEBOOK}" ]; then
     echo "$INFO" "Found ${VOILA_NOTEBOOK}... Starting in voila mode"
-    voila "${VOILA_NOTEBOOK}" --enable_nbextensions=True --port 8888 --no-browser --base_url=${SIMCORE_NODE_BASEPATH}/
+    # kernels are preheated with the notebook, refreshed when it or the inputs change
+    # (by another voila behind the same port, see jupyter_commons.voila_launcher)
+    "${COMMONS_PYTHON}" -m jupyter_commons.voila_launcher "${VOILA_NOTEBOOK}" --inputs "${INPUTS_FOLDER}" --port 8888 -- \
+        --enable_nbextensions=True --no-browser --base_url="${SIMCORE_NODE_BASEPATH}/"
 else
     # call the notebook with the basic parameters
     start-notebook.sh --config .jupyter_config.json "$@"
@@ -8,32 +8,70 @@ Example of usage in a Dockerfile
                 --timeout=30s \
                 --start-period=1s \
                 --retries=3 \
-                CMD python3 docker/run_health_check.py http://localhost:8080/v0/
+                CMD python3 -I -S docker/run_health_check.py http://localhost:8888
 ```
 
+Queries the /healthz endpoint (see jupyter_commons.handlers.health) which answers
+from memory, i.e. without rendering the tree page. It reports the readiness of the
+service: healthy while the state is being restored or large files are transferred,
+but not if the restore failed or the watcher died.
+
+In voila mode (AS_VOILA=1 and a voila.ipynb) the server extensions are not loaded:
+any answer to /healthz but a server error shows voila is up. The dashboard itself
+is never requested, it would use up a preheated kernel (see voila_launcher).
+
+Runs with -I -S and only imports http.client to start as fast as possible.
+
 Q&A:
     1. why not to use curl instead of a python script?
         - SEE https://blog.sixeyed.com/docker-healthchecks-why-not-to-use-curl-or-iwr/
 """
 
+import http.client
 import os
 import sys
-from urllib.request import urlopen
 
 HEALTHY, UNHEALTHY = 0, 1
 
-# Disabled if boots with debugger
-ok = os.environ.get("SC_BOOT_MODE").lower() == "debug"
-
-# Queries host
-ok = (
-    ok
-    or urlopen(
-        "{host}{baseurl}".format(
-            host=sys.argv[1], baseurl=os.environ.get("SIMCORE_NODE_BASEPATH", "")
-        )  # adds a base-path if defined in environ
-    ).getcode()
-    == 200
-)
-
-sys.exit(HEALTHY if ok else UNHEALTHY)
+TIMEOUT = 5.0
+
+
+def get_status(url: str) -> int:
+    scheme, _, netloc_and_path = url.partition("://")
+    netloc, _, path = netloc_and_path.partition("/")
+    connection_class = (
+        http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    )
+    connection = connection_class(netloc, timeout=TIMEOUT)
+    try:
+        connection.request("GET", "/" + path)
+        response = connection.getresponse()
+        print(response.status, response.read(4096).decode(errors="replace"))
+        return response.status
+    finally:
+        connection.close()
+
+
+def main(host: str) -> int:
+    # Disabled if boots with debugger
+    if os.environ.get("SC_BOOT_MODE", "").lower() == "debug":
+        return HEALTHY
+
+    # adds a base-path if defined in environ
+    base_url = "{host}{baseurl}".format(
+        host=host.rstrip("/"), baseurl=os.environ.get("SIMCORE_NODE_BASEPATH", "")
+    )
+    try:
+        status = get_status(base_url.rstrip("/") + "/healthz")
+    except OSError as exc:
+        print("unhealthy:", exc)
+        return UNHEALTHY
+    if status == 200:
+        return HEALTHY
+    # e.g. a 404 or a redirection to voila's files
+    as_voila = os.environ.get("AS_VOILA", "0") == "1"
+    return HEALTHY if as_voila and status < 500 else UNHEALTHY
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1]))
@@ -0,0 +1,248 @@
+"""
+Benchmarks the retrieve/push/state pipelines against a local storage stand-in
+
+Runs download_data, upload_data and the state push/pull (as done by
+StateHandler) for every combination of port count, file count and file size.
+A single file port is transferred as is, several files (and the state) are
+zipped. The storage is a local folder with configurable latency and bandwidth
+(see fake_simcore.py).
+
+    python benchmarks/bench_transfers.py --output results.json
+    python benchmarks/bench_transfers.py --ports 1 8 --files 1 100 --file-sizes 1024 1048576
+    python benchmarks/compare.py previous.json results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import fake_simcore
+
+CASES = ("retrieve", "push", "state_push", "state_pull")
+# the state is a single folder, the port count does not apply
+_STATE_CASES = ("state_push", "state_pull")
+
+_RANDOM_CHUNK_SIZE = 1024 * 1024
+
+
+def _write_random_file(path: Path, size: int) -> None:
+    # random, i.e. incompressible, like most of the data
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunk = os.urandom(min(size, _RANDOM_CHUNK_SIZE))
+    with path.open("wb") as file:
+        for offset in range(0, size, len(chunk)):
+            file.write(chunk[: size - offset])
+
+
+def _write_files(folder: Path, files: int, file_size: int) -> None:
+    for number in range(files):
+        _write_random_file(folder / f"file_{number:05}.bin", file_size)
+
+
+def _reset_folder(folder: Path) -> None:
+    shutil.rmtree(folder, ignore_errors=True)
+    folder.mkdir(parents=True)
+
+
+class Benchmark:
+    """Prepares the storage and the local folders for each case"""
+
+    def __init__(self, workdir: Path, storage: fake_simcore.LocalStorage, nodeports):
+        self.workdir = workdir
+        self.storage = storage
+        self.nodeports = nodeports
+        self.inputs_path = workdir / "inputs"
+        self.outputs_path = workdir / "outputs"
+        self.state_path = workdir / "work"
+
+    def setup_inputs(self, ports: int, files: int, file_size: int) -> None:
+        self.nodeports.input_ports.clear()
+        for number in range(ports):
+            key = f"input_{number}"
+            if files == 1:
+                name = f"inputs/{key}/file.bin"
+                _write_random_file(self.storage.object_path(name), file_size)
+            else:
+                name = f"inputs/{key}/{key}.zip"
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    _write_files(Path(tmp_dir), files, file_size)
+                    archive_path = self.storage.object_path(name)
+                    archive_path.parent.mkdir(parents=True, exist_ok=True)
+                    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as zip_file:
+                        for path in sorted(Path(tmp_dir).iterdir()):
+                            zip_file.write(path, path.name)
+            self.nodeports.input_ports[key] = fake_simcore.FakePort(
+                self.storage, key, fake_simcore.FILE_TYPE, name
+            )
+
+    def setup_outputs(self, ports: int, files: int, file_size: int) -> None:
+        self.nodeports.output_ports.clear()
+        _reset_folder(self.outputs_path)
+        for number in range(ports):
+            key = f"output_{number}"
+            _write_files(self.outputs_path / key, files, file_size)
+            self.nodeports.output_ports[key] = fake_simcore.FakePort(
+                self.storage, key, fake_simcore.FILE_TYPE
+            )
+
+    def prepare(self, case: str, ports: int, files: int, file_size: int) -> Callable:
+        """Returns the coroutine function to be timed, called before each run"""
+        # pylint: disable=import-outside-toplevel
+        if case == "retrieve":
+            from jupyter_commons.handlers import _input_retriever
+
+            self.setup_inputs(ports, files, file_size)
+
+            async def run():
+                _reset_folder(self.inputs_path)
+                return await _input_retriever.download_data(port_keys=[])
+
+            return run
+
+        if case == "push":
+            from jupyter_commons.handlers import _input_retriever
+
+            self.setup_outputs(ports, files, file_size)
+            return lambda: _input_retriever.upload_data(port_keys=[])
+
+        from jupyter_commons import restore, snapshots
+
+        _reset_folder(self.state_path)
+        _write_files(self.state_path, files, file_size)
+        if case == "state_push":
+            return lambda: snapshots.save_state(self.state_path, full=True)
+
+        # state_pull
+        asyncio.get_event_loop().run_until_complete(
+            snapshots.save_state(self.state_path, full=True)
+        )
+
+        async def run():
+            _reset_folder(self.state_path)
+            await restore.restore_state(self.state_path)
+            return files * file_size
+
+        return run
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=str(Path(__file__).parent),
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_matrix(benchmark: Benchmark, options) -> List[Dict]:
+    loop = asyncio.get_event_loop()
+    results = []
+    for case, files, file_size, ports in itertools.product(
+        options.cases, options.files, options.file_sizes, options.ports
+    ):
+        if case in _STATE_CASES and ports != options.ports[0]:
+            continue
+        run = benchmark.prepare(case, ports, files, file_size)
+        timings = []
+        for _ in range(options.repeat):
+            start_time = time.perf_counter()
+            loop.run_until_complete(run())
+            timings.append(time.perf_counter() - start_time)
+
+        total_bytes = files * file_size * (1 if case in _STATE_CASES else ports)
+        median = statistics.median(timings)
+        result = {
+            "case": case,
+            "ports": None if case in _STATE_CASES else ports,
+            "files": files,
+            "file_size": file_size,
+            "layout": "single" if files == 1 and case not in _STATE_CASES else "zip",
+            "bytes": total_bytes,
+            "seconds": {"min": min(timings), "median": median, "max": max(timings)},
+            "mb_per_second": round(total_bytes / 1024 / 1024 / median, 3),
+        }
+        print(
+            "{case:>10} ports={ports} files={files} size={file_size}: {median:.3f}s".format(
+                median=median, **result
+            ),
+            file=sys.stderr,
+        )
+        results.append(result)
+    return results
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--ports", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--files", nargs="+", type=int, default=[1, 64])
+    parser.add_argument(
+        "--file-sizes", nargs="+", type=int, default=[64 * 1024, 4 * 1024 * 1024]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per storage request"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=0, help="storage MB/s, 0 for unlimited"
+    )
+    parser.add_argument("--output", type=Path, help="JSON results, defaults to stdout")
+    options = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory(prefix="bench-transfers-") as tmp_dir:
+        workdir = Path(tmp_dir)
+        storage = fake_simcore.LocalStorage(
+            workdir / "storage", options.latency, options.bandwidth * 1024 * 1024
+        )
+        nodeports = fake_simcore.install(storage)
+        # read by jupyter_commons when imported, keeps ~/.osparc out of it
+        os.environ.update(
+            {
+                "HOME": str(workdir / "home"),
+                "INPUTS_FOLDER": str(workdir / "inputs"),
+                "OUTPUTS_FOLDER": str(workdir / "outputs"),
+                "SIMCORE_NODE_APP_STATE_PATH": str(workdir / "work"),
+            }
+        )
+        results = run_matrix(Benchmark(workdir, storage, nodeports), options)
+
+    report = json.dumps(
+        {
+            "meta": {
+                "created_at": time.time(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "latency": options.latency,
+                "bandwidth": options.bandwidth,
+                "repeat": options.repeat,
+            },
+            "results": results,
+        },
+        indent=2,
+    )
+    if options.output:
+        options.output.write_text(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Compares two results of bench_transfers.py, fails if a case got slower
+
+    python benchmarks/compare.py previous.json results.json [--tolerance 0.2]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _key(result: dict) -> tuple:
+    return (result["case"], result["ports"], result["files"], result["file_size"])
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("previous", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="accepted slowdown, 0.2 is 20%%"
+    )
+    options = parser.parse_args(args)
+
+    previous = {
+        _key(r): r for r in json.loads(options.previous.read_text())["results"]
+    }
+    regressions = 0
+    for result in json.loads(options.current.read_text())["results"]:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        change = result["seconds"]["median"] / before["seconds"]["median"] - 1
+        regressed = change > options.tolerance
+        regressions += regressed
+        print(
+            "{flag} {case:>10} ports={ports} files={files} size={file_size}: "
+            "{before:.3f}s -> {after:.3f}s ({change:+.0%})".format(
+                flag="!!" if regressed else "  ",
+                before=before["seconds"]["median"],
+                after=result["seconds"]["median"],
+                change=change,
+                **result,
+            )
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
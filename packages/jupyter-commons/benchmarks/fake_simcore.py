@@ -0,0 +1,198 @@
+"""
+Local stand-in for the storage side of simcore_sdk
+
+Replaces simcore_sdk.node_ports_v2 and simcore_sdk.node_data.data_manager with
+fakes backed by a local folder. Every transfer waits for a configurable latency
+and is throttled to a configurable bandwidth, so that the pipelines of
+jupyter_commons can be measured without an osparc deployment.
+
+    storage = LocalStorage(Path("/tmp/storage"), latency=0.05, bandwidth=50e6)
+    install(storage)  # before importing jupyter_commons
+"""
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+import types
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+FILE_TYPE = "data:*/*"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class LocalStorage:
+    """Objects are files below root, shared by all the fakes"""
+
+    def __init__(self, root: Path, latency: float = 0.0, bandwidth: float = 0.0):
+        # latency in seconds per request, bandwidth in bytes per second (0: unlimited)
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, name: str) -> Path:
+        return self.root / name
+
+    def _copy(self, src: Path, dst: Path) -> int:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        start_time = time.perf_counter()
+        transferred = 0
+        with src.open("rb") as src_file, dst.open("wb") as dst_file:
+            for chunk in iter(lambda: src_file.read(_CHUNK_SIZE), b""):
+                dst_file.write(chunk)
+                transferred += len(chunk)
+                if self.bandwidth:
+                    ahead = transferred / self.bandwidth - (time.perf_counter() - start_time)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        return transferred
+
+    async def transfer(self, src: Path, dst: Path) -> int:
+        await asyncio.sleep(self.latency)
+        return await asyncio.get_event_loop().run_in_executor(None, self._copy, src, dst)
+
+    async def exists(self, name: str) -> bool:
+        await asyncio.sleep(self.latency)
+        return self.object_path(name).exists()
+
+
+class FakePort:
+    def __init__(self, storage: LocalStorage, key: str, property_type: str, value: Any = None):
+        self._storage = storage
+        self.key = key
+        self.property_type = property_type
+        self.value = value
+
+    async def get(self) -> Optional[Union[Path, Any]]:
+        if FILE_TYPE != self.property_type:
+            await asyncio.sleep(self._storage.latency)
+            return self.value
+        if self.value is None:
+            return None
+        # like node_ports, downloads into a new temporary folder
+        downloaded_file = Path(tempfile.mkdtemp()) / Path(self.value).name
+        await self._storage.transfer(self._storage.object_path(self.value), downloaded_file)
+        return downloaded_file
+
+    async def set(self, value: Optional[Any]) -> None:
+        if FILE_TYPE == self.property_type and value is not None:
+            name = f"outputs/{self.key}/{Path(value).name}"
+            await self._storage.transfer(Path(value), self._storage.object_path(name))
+            self.value = name
+        else:
+            await asyncio.sleep(self._storage.latency)
+            self.value = value
+
+
+class FakeNodeports:
+    def __init__(self, inputs: Dict[str, FakePort], outputs: Dict[str, FakePort]):
+        # configured by the benchmarks, node_ports_v2 exposes them as awaitables
+        self.input_ports = inputs
+        self.output_ports = outputs
+
+    @property
+    async def inputs(self) -> Dict[str, FakePort]:
+        return self.input_ports
+
+    @property
+    async def outputs(self) -> Dict[str, FakePort]:
+        return self.output_ports
+
+
+class NodeportsException(Exception):
+    pass
+
+
+class S3InvalidPathError(NodeportsException):
+    pass
+
+
+def _node_ports_v2_module(storage: LocalStorage, nodeports: FakeNodeports):
+    module = types.ModuleType("simcore_sdk.node_ports_v2")
+
+    async def ports() -> FakeNodeports:
+        await asyncio.sleep(storage.latency)
+        return nodeports
+
+    module.ports = ports
+    module.Nodeports = FakeNodeports
+    module.Port = FakePort
+
+    exceptions = types.ModuleType("simcore_sdk.node_ports_v2.exceptions")
+    exceptions.NodeportsException = NodeportsException
+    exceptions.S3InvalidPathError = S3InvalidPathError
+    module.exceptions = exceptions
+
+    links = types.ModuleType("simcore_sdk.node_ports_v2.links")
+    links.ItemConcreteValue = Union[int, float, bool, str, Path]
+    module.links = links
+    return module
+
+
+def _data_manager_module(storage: LocalStorage):
+    """Same semantics as simcore_sdk.node_data.data_manager: folders are zipped"""
+    module = types.ModuleType("simcore_sdk.node_data.data_manager")
+
+    def _object_name(path: Path) -> str:
+        return path.name if path.is_file() or path.suffix else f"{path.name}.zip"
+
+    async def push(file_or_folder: Path) -> None:
+        if file_or_folder.is_file():
+            await storage.transfer(file_or_folder, storage.object_path(file_or_folder.name))
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = Path(tmp_dir) / f"{file_or_folder.name}.zip"
+            shutil.make_archive(str(archive_path.with_suffix("")), "zip", str(file_or_folder))
+            await storage.transfer(archive_path, storage.object_path(archive_path.name))
+
+    async def pull(file_or_folder: Path, change_permissions: bool = True) -> None:
+        # pylint: disable=unused-argument
+        if file_or_folder.is_file():
+            await storage.transfer(storage.object_path(file_or_folder.name), file_or_folder)
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = Path(tmp_dir) / _object_name(file_or_folder)
+            await storage.transfer(storage.object_path(archive_path.name), archive_path)
+            file_or_folder.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(archive_path) as zip_file:
+                zip_file.extractall(file_or_folder)
+
+    async def is_file_present_in_storage(file_path: Path) -> bool:
+        return await storage.exists(_object_name(file_path))
+
+    module.push = push
+    module.pull = pull
+    module.is_file_present_in_storage = is_file_present_in_storage
+    return module
+
+
+def install(storage: LocalStorage, nodeports: Optional[FakeNodeports] = None) -> FakeNodeports:
+    """Registers the fakes in sys.modules, returns the ports to be configured"""
+    nodeports = nodeports or FakeNodeports(inputs={}, outputs={})
+    try:
+        import simcore_sdk  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        simcore_sdk = types.ModuleType("simcore_sdk")
+        simcore_sdk.__path__ = []
+        sys.modules["simcore_sdk"] = simcore_sdk
+
+    node_ports_v2 = _node_ports_v2_module(storage, nodeports)
+    node_data = types.ModuleType("simcore_sdk.node_data")
+    node_data.data_manager = _data_manager_module(storage)
+
+    simcore_sdk.node_ports_v2 = node_ports_v2
+    simcore_sdk.node_data = node_data
+    sys.modules.update(
+        {
+            "simcore_sdk.node_ports_v2": node_ports_v2,
+            "simcore_sdk.node_ports_v2.exceptions": node_ports_v2.exceptions,
+            "simcore_sdk.node_ports_v2.links": node_ports_v2.links,
+            "simcore_sdk.node_data": node_data,
+            "simcore_sdk.node_data.data_manager": node_data.data_manager,
+        }
+    )
+    return nodeports
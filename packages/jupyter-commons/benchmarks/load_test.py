@@ -0,0 +1,274 @@
+"""
+Load test of the jupyter_commons server extensions
+
+Serves the retrieve, push, state, watcher and health extensions from a tornado
+server (in its own thread, like the notebook server) on top of the storage
+stand-in of fake_simcore.py. Concurrent clients send a weighted mix of requests
+for a given duration while the server event loop lag is sampled. The "watcher"
+operation writes a file in the outputs folder, i.e. triggers the watcher push.
+
+    python benchmarks/load_test.py --concurrency 16 --duration 30
+    python benchmarks/load_test.py --mix retrieve=1,push=4,state=1,health=10,watcher=4
+
+Reports the p50/p95/p99 latency and throughput per operation and the event
+loop lag as JSON.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fake_simcore
+from bench_transfers import Benchmark
+
+EXTENSIONS = (
+    "jupyter_commons.handlers.retrieve",
+    "jupyter_commons.handlers.push",
+    "jupyter_commons.handlers.state",
+    "jupyter_commons.handlers.watcher",
+    "jupyter_commons.handlers.health",
+)
+
+# method, path, body
+REQUESTS = {
+    "retrieve": ("POST", "/retrieve", json.dumps({"port_keys": []})),
+    "push": ("POST", "/push", json.dumps({"port_keys": []})),
+    "state": ("POST", "/state", ""),
+    "state_pull": ("GET", "/state", None),
+    "health": ("GET", "/healthz", None),
+}
+WATCHER = "watcher"
+
+DEFAULT_MIX = "retrieve=1,push=2,state=1,health=4,watcher=2"
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def nearest_rank(percent: float) -> float:
+        return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+    return {
+        "p50": round(nearest_rank(50), 6),
+        "p95": round(nearest_rank(95), 6),
+        "p99": round(nearest_rank(99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+class LagMonitor:
+    """Samples how late the event loop wakes up a sleeping coroutine"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, extensions, state_path: Path):
+        super().__init__(daemon=True)
+        self.extensions = extensions
+        self.state_path = state_path
+        self.port: Optional[int] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lag_monitor = LagMonitor()
+        self.started = threading.Event()
+
+    def run(self):
+        # pylint: disable=import-outside-toplevel
+        from tornado import httpserver, netutil, web
+
+        from jupyter_commons import snapshots
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # GET /state restores the stored state
+        self.loop.run_until_complete(snapshots.save_state(self.state_path, full=True))
+
+        # settings of docker/boot_notebook.bash
+        web_app = web.Application(
+            base_url="/", allow_remote_access=True, disable_check_xsrf=True
+        )
+        nb_server_app = types.SimpleNamespace(
+            web_app=web_app, log=logging.getLogger("load_test")
+        )
+        for extension in self.extensions:
+            importlib.import_module(extension).load_jupyter_server_extension(
+                nb_server_app
+            )
+
+        sockets = netutil.bind_sockets(0, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        httpserver.HTTPServer(web_app).add_sockets(sockets)
+
+        self.loop.create_task(self.lag_monitor.run())
+        self.loop.call_soon(self.started.set)
+        self.loop.run_forever()
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, mix: Dict[str, float], outputs_path: Path):
+        self.base_url = base_url
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.outputs_path = outputs_path
+        self.latencies: Dict[str, List[float]] = {op: [] for op in self.operations}
+        self.status_codes: Dict[str, Counter] = {op: Counter() for op in self.operations}
+
+    async def _watcher_event(self, client_number: int) -> None:
+        # the outputs are watched, see jupyter_commons.handlers.watcher
+        path = self.outputs_path / "output_0" / f"client_{client_number}.bin"
+        await asyncio.get_event_loop().run_in_executor(
+            None, path.write_bytes, os.urandom(1024)
+        )
+
+    async def client(self, client_number: int, http_client, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            operation = random.choices(self.operations, self.weights)[0]
+            start_time = time.perf_counter()
+            if operation == WATCHER:
+                await self._watcher_event(client_number)
+                status_code = 0
+            else:
+                method, path, body = REQUESTS[operation]
+                response = await http_client.fetch(
+                    self.base_url + path,
+                    method=method,
+                    body=body,
+                    raise_error=False,
+                    request_timeout=600,
+                )
+                # e.g. 503 while the state is restored, 599 on timeouts
+                status_code = response.code
+            self.latencies[operation].append(time.perf_counter() - start_time)
+            self.status_codes[operation][status_code] += 1
+
+    async def run(self, concurrency: int, duration: float) -> float:
+        from tornado.httpclient import AsyncHTTPClient  # pylint: disable=import-outside-toplevel
+
+        http_client = AsyncHTTPClient(max_clients=concurrency)
+        start_time = time.perf_counter()
+        deadline = start_time + duration
+        await asyncio.gather(
+            *[self.client(number, http_client, deadline) for number in range(concurrency)]
+        )
+        return time.perf_counter() - start_time
+
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        operation, _, weight = item.partition("=")
+        if operation not in REQUESTS and operation != WATCHER:
+            raise argparse.ArgumentTypeError(f"unknown operation {operation}")
+        weights[operation] = float(weight or 1)
+    return weights
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--ports", type=int, default=2, help="per direction")
+    parser.add_argument("--files", type=int, default=8, help="per port")
+    parser.add_argument("--file-size", type=int, default=256 * 1024)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=float, default=0, help="MB/s, 0: unlimited")
+    parser.add_argument("--output", type=Path, help="JSON results, defaults to stdout")
+    options = parser.parse_args(args)
+
+    workdir = Path(tempfile.mkdtemp(prefix="load-test-"))
+    storage = fake_simcore.LocalStorage(
+        workdir / "storage", options.latency, options.bandwidth * 1024 * 1024
+    )
+    nodeports = fake_simcore.install(storage)
+    os.environ.update(
+        {
+            "HOME": str(workdir / "home"),
+            "INPUTS_FOLDER": str(workdir / "inputs"),
+            "OUTPUTS_FOLDER": str(workdir / "outputs"),
+            "SIMCORE_NODE_APP_STATE_PATH": str(workdir / "work"),
+        }
+    )
+    benchmark = Benchmark(workdir, storage, nodeports)
+    benchmark.setup_inputs(options.ports, options.files, options.file_size)
+    benchmark.setup_outputs(options.ports, options.files, options.file_size)
+    benchmark.inputs_path.mkdir()
+    benchmark.state_path.mkdir()
+    for number in range(options.files):
+        (benchmark.state_path / f"notebook_{number}.ipynb").write_text("{}")
+
+    server = ServerThread(EXTENSIONS, benchmark.state_path)
+    server.start()
+    server.started.wait()
+
+    load_generator = LoadGenerator(
+        f"http://127.0.0.1:{server.port}", options.mix, benchmark.outputs_path
+    )
+    elapsed_time = asyncio.get_event_loop().run_until_complete(
+        load_generator.run(options.concurrency, options.duration)
+    )
+
+    report = {
+        "meta": {
+            "created_at": time.time(),
+            "concurrency": options.concurrency,
+            "duration": elapsed_time,
+            "mix": options.mix,
+            "ports": options.ports,
+            "files": options.files,
+            "file_size": options.file_size,
+            "latency": options.latency,
+            "bandwidth": options.bandwidth,
+        },
+        "operations": {
+            operation: {
+                "count": len(samples),
+                "status_codes": dict(load_generator.status_codes[operation]),
+                "throughput": round(len(samples) / elapsed_time, 3),
+                "latency": percentiles(samples),
+            }
+            for operation, samples in load_generator.latencies.items()
+        },
+        "throughput": round(
+            sum(map(len, load_generator.latencies.values())) / elapsed_time, 3
+        ),
+        "event_loop_lag": percentiles(server.lag_monitor.samples),
+    }
+    report = json.dumps(report, indent=2)
+    if options.output:
+        options.output.write_text(report)
+    else:
+        print(report)
+
+    sys.stdout.flush()
+    # NOTE: the watcher never returns, its executor thread would keep us alive
+    os._exit(0)  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    main()
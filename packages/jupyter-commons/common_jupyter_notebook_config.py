@@ -1,2 +1,14 @@
+import os
+
 # moving checkpoints outside ~/work directory in the home directory
 c.FileCheckpoints.checkpoint_dir = "/home/jovyan/._ipynb_checkpoints/"
+
+# waits for files still being restored, see state_puller.py
+c.NotebookApp.contents_manager_class = "jupyter_commons.contents.StateContentsManager"
+c.NotebookApp.nbserver_extensions.update({"jupyter_commons.contents": True})
+
+# notebook signatures are kept with the state, see jupyter_commons.trust
+if "SIMCORE_NODE_APP_STATE_PATH" in os.environ:
+    c.NotebookNotary.data_dir = os.path.join(
+        os.environ["SIMCORE_NODE_APP_STATE_PATH"], ".jupyter_trust"
+    )
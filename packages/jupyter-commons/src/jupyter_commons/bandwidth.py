@@ -0,0 +1,179 @@
+"""
+Shares the network link of the service between its transfers
+
+Inputs retrieval, outputs push and state snapshots all go through the same
+governor, in three priority classes:
+
+- interactive: the inputs a user is waiting for (/retrieve)
+- push: the outputs (/push and the watcher) and the state pushed by POST /state
+  (e.g. at shutdown, the platform is waiting for it)
+- background: the state otherwise (autosave and restore)
+
+A transfer only starts once no transfer of a higher class is running or
+waiting, i.e. a push triggered by the watcher does not compete with a
+retrieve. On top of that, SIMCORE_TRANSFER_MAX_BYTES_PER_SECOND (0: unlimited)
+caps the total with token buckets: the bytes are charged before a transfer
+when known (uploads, archives) or once it is done (downloads) and, while the
+bucket of its class is in debt, no transfer of that class starts.
+
+Every class has its own bucket, charged with the bytes of that class and of
+the higher ones: the background bucket caps the total, while the debt of a
+large snapshot never delays a retrieve.
+
+NOTE: the bytes themselves are moved by simcore_sdk, the governor decides
+when a transfer may start, not how fast it runs.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+PUSH = "push"
+BACKGROUND = "background"
+# highest priority first
+PRIORITIES = (INTERACTIVE, PUSH, BACKGROUND)
+
+MAX_BYTES_PER_SECOND = int(os.environ.get("SIMCORE_TRANSFER_MAX_BYTES_PER_SECOND", "0"))
+BURST_BYTES = int(os.environ.get("SIMCORE_TRANSFER_BURST_BYTES", str(16 * 1024 * 1024)))
+
+# seconds, the utilization is averaged over that window
+_UTILIZATION_WINDOW = 10.0
+_MIN_DELAY = 0.05
+_MAX_DELAY = 1.0
+
+
+@dataclass
+class ClassStats:
+    active: int = 0
+    waiting: int = 0
+    transfers: int = 0
+    bytes: int = 0
+    waited_seconds: float = 0.0
+
+
+class Transfer:
+    """Async context manager returned by BandwidthGovernor.transfer"""
+
+    def __init__(self, governor: "BandwidthGovernor", priority: str, num_bytes: int):
+        self._governor = governor
+        self.priority = priority
+        self._num_bytes = num_bytes
+
+    async def __aenter__(self) -> "Transfer":
+        await self._governor.admit(self.priority)
+        self.charge(self._num_bytes)
+        return self
+
+    async def __aexit__(self, *exc_info) -> bool:
+        self._governor.finish(self.priority)
+        return False
+
+    def charge(self, num_bytes: int) -> None:
+        """Accounts for bytes only known once transferred"""
+        self._governor.charge(self.priority, num_bytes)
+
+
+class BandwidthGovernor:
+    def __init__(self, max_bytes_per_second: int, burst_bytes: int):
+        self.max_bytes_per_second = max_bytes_per_second
+        self.burst_bytes = burst_bytes
+        self._tokens: Dict[str, float] = {p: float(burst_bytes) for p in PRIORITIES}
+        self._updated = time.monotonic()
+        self._classes: Dict[str, ClassStats] = {p: ClassStats() for p in PRIORITIES}
+        self._history: Deque[Tuple[float, int]] = deque()
+
+    def transfer(self, priority: str, num_bytes: int = 0) -> Transfer:
+        """Waits for the turn of a transfer of num_bytes (0: unknown yet)"""
+        assert priority in PRIORITIES, f"unknown priority {priority}"
+        return Transfer(self, priority, num_bytes)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        refilled = (now - self._updated) * self.max_bytes_per_second
+        for priority, tokens in self._tokens.items():
+            self._tokens[priority] = min(self.burst_bytes, tokens + refilled)
+        self._updated = now
+
+    def _debt(self, priority: str) -> float:
+        return max(-self._tokens[priority], 0.0)
+
+    def _delay(self, priority: str) -> Optional[float]:
+        """How long to wait before checking again, None if it may start now"""
+        for higher in PRIORITIES[: PRIORITIES.index(priority)]:
+            if self._classes[higher].active or self._classes[higher].waiting:
+                return _MIN_DELAY
+        if not self.max_bytes_per_second:
+            return None
+        self._refill()
+        debt = self._debt(priority)
+        if not debt:
+            return None
+        # until the debt is paid back
+        return min(max(debt / self.max_bytes_per_second, _MIN_DELAY), _MAX_DELAY)
+
+    async def admit(self, priority: str) -> None:
+        stats = self._classes[priority]
+        delay = self._delay(priority)
+        if delay is not None:
+            started_at = time.monotonic()
+            stats.waiting += 1
+            try:
+                while delay is not None:
+                    await asyncio.sleep(delay)
+                    delay = self._delay(priority)
+            finally:
+                stats.waiting -= 1
+                waited = time.monotonic() - started_at
+                stats.waited_seconds += waited
+            log.debug("%s transfer started after waiting %ss", priority, round(waited, 3))
+        stats.active += 1
+        stats.transfers += 1
+
+    def finish(self, priority: str) -> None:
+        self._classes[priority].active -= 1
+
+    def charge(self, priority: str, num_bytes: int) -> None:
+        if num_bytes <= 0:
+            return
+        self._classes[priority].bytes += num_bytes
+        self._history.append((time.monotonic(), num_bytes))
+        if self.max_bytes_per_second:
+            self._refill()
+            # the lower classes share the same link
+            for lower in PRIORITIES[PRIORITIES.index(priority) :]:
+                self._tokens[lower] -= num_bytes
+
+    def _recent_bytes_per_second(self) -> float:
+        window_start = time.monotonic() - _UTILIZATION_WINDOW
+        while self._history and self._history[0][0] < window_start:
+            self._history.popleft()
+        return sum(num_bytes for _, num_bytes in self._history) / _UTILIZATION_WINDOW
+
+    def stats(self) -> dict:
+        bytes_per_second = self._recent_bytes_per_second()
+        if self.max_bytes_per_second:
+            self._refill()
+        return {
+            "max_bytes_per_second": self.max_bytes_per_second or None,
+            "bytes_per_second": round(bytes_per_second),
+            "utilization": round(bytes_per_second / self.max_bytes_per_second, 3)
+            if self.max_bytes_per_second
+            else None,
+            "classes": {
+                p: {
+                    **asdict(stats),
+                    "waited_seconds": round(stats.waited_seconds, 3),
+                    "debt_bytes": round(self._debt(p)) if self.max_bytes_per_second else 0,
+                }
+                for p, stats in self._classes.items()
+            },
+        }
+
+
+governor = BandwidthGovernor(MAX_BYTES_PER_SECOND, BURST_BYTES)
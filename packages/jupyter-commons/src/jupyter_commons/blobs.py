@@ -0,0 +1,202 @@
+"""
+Large notebook outputs kept as content-addressed sidecar files
+
+Embedded plots easily make notebooks hundreds of MB large, which are rewritten
+by every save, duplicated by every checkpoint and archived again by every state
+snapshot. Instead, outputs above MIN_OUTPUT_SIZE are written once to
+``.ipynb_blobs/`` (next to the notebooks, i.e. part of the state) and the
+notebook only keeps a reference in the output metadata:
+
+    "metadata": {"osparc_blobs": {"image/png": "<sha256>"}}
+
+Identical outputs (e.g. in the checkpoints) share the same blob. Notebooks are
+rehydrated when read, see contents.StateContentsManager and trust.py.
+
+NOTE: the .ipynb files on disk (and in the state snapshots) are only complete
+with their blobs. The notebook server serves them complete, also as files (i.e.
+downloads), but anything reading them directly (e.g. ``jupyter nbconvert`` on
+the command line) gets empty outputs. ``rehydrate`` (or serving through the
+server, ``/files/PATH``) restores them.
+
+    python -m jupyter_commons.blobs gc PATH [--checkpoints FOLDER]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Set
+
+log = logging.getLogger(__name__)
+
+BLOBS_DIR_NAME = ".ipynb_blobs"
+METADATA_KEY = "osparc_blobs"
+# characters of a single output mimetype, 0 disables the externalization
+MIN_OUTPUT_SIZE = int(os.environ.get("SIMCORE_NOTEBOOK_BLOB_MIN_SIZE", str(256 * 1024)))
+
+_EXTERNALIZED_OUTPUT_TYPES = ("display_data", "execute_result")
+
+
+def _is_json_mimetype(mimetype: str) -> bool:
+    # same rule as nbformat: these are stored as JSON, not as (multiline) strings
+    return mimetype == "application/json" or (
+        mimetype.startswith("application/") and mimetype.endswith("+json")
+    )
+
+
+def _placeholder(mimetype: str):
+    return {} if _is_json_mimetype(mimetype) else ""
+
+
+def blob_path(blobs_dir: Path, digest: str) -> Path:
+    return blobs_dir / digest[:2] / digest
+
+
+def _serialize(mimetype: str, value) -> str:
+    if _is_json_mimetype(mimetype):
+        return json.dumps(value, sort_keys=True)
+    return value if isinstance(value, str) else "".join(value)
+
+
+def _write_blob(blobs_dir: Path, content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    path = blob_path(blobs_dir, digest)
+    if path.exists():
+        # protects it from a concurrent garbage collection
+        os.utime(str(path))
+        return digest
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{digest}.tmp")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
+    return digest
+
+
+def _iter_outputs(nb) -> Iterator[dict]:
+    for cell in nb.get("cells", []):
+        for output in cell.get("outputs", []):
+            if output.get("output_type") in _EXTERNALIZED_OUTPUT_TYPES:
+                yield output
+
+
+def externalize(nb, blobs_dir: Path, min_size: int = MIN_OUTPUT_SIZE):
+    """Returns a copy of the notebook whose large outputs are written as blobs"""
+    if min_size <= 0:
+        return nb
+    # NOTE: the (large) strings are shared, not copied
+    nb = copy.deepcopy(nb)
+    for output in _iter_outputs(nb):
+        metadata = output.setdefault("metadata", {})
+        data = output.get("data", {})
+        references = {
+            mimetype: digest
+            for mimetype, digest in metadata.get(METADATA_KEY, {}).items()
+            if mimetype in data
+        }
+        for mimetype, value in data.items():
+            if value == _placeholder(mimetype) and mimetype in references:
+                # could not be rehydrated, keeps the reference as is
+                continue
+            references.pop(mimetype, None)
+            content = _serialize(mimetype, value)
+            if len(content) < min_size:
+                continue
+            references[mimetype] = _write_blob(blobs_dir, content.encode("utf-8"))
+            data[mimetype] = _placeholder(mimetype)
+        if references:
+            metadata[METADATA_KEY] = references
+        else:
+            metadata.pop(METADATA_KEY, None)
+    return nb
+
+
+def rehydrate(nb, blobs_dir: Path):
+    """Puts the blobs back in place (in the notebook read from disk)"""
+    for output in _iter_outputs(nb):
+        references = output.get("metadata", {}).get(METADATA_KEY)
+        if not references:
+            continue
+        for mimetype, digest in list(references.items()):
+            try:
+                content = blob_path(blobs_dir, digest).read_text(encoding="utf-8")
+            except FileNotFoundError:
+                log.warning("output %s is missing, left empty", digest)
+                continue
+            output["data"][mimetype] = (
+                json.loads(content) if _is_json_mimetype(mimetype) else content
+            )
+            del references[mimetype]
+        if not references:
+            del output["metadata"][METADATA_KEY]
+    return nb
+
+
+def _referenced_digests(notebook_path: Path) -> Set[str]:
+    try:
+        nb = json.loads(notebook_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        log.warning("could not read %s, its outputs might be collected", notebook_path)
+        return set()
+    digests = set()
+    for output in _iter_outputs(nb):
+        digests.update(output.get("metadata", {}).get(METADATA_KEY, {}).values())
+    return digests
+
+
+def _iter_notebook_paths(folder: Path) -> Iterator[Path]:
+    for parent, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [d for d in dirnames if d != BLOBS_DIR_NAME]
+        for filename in filenames:
+            if filename.endswith(".ipynb"):
+                yield Path(parent) / filename
+
+
+def collect_garbage(root: Path, checkpoints_dir: Optional[Path] = None) -> int:
+    """Removes the blobs no notebook (or checkpoint) refers to, returns how many"""
+    blobs_dir = root / BLOBS_DIR_NAME
+    if not blobs_dir.exists():
+        return 0
+    started_at = time.time()
+    referenced: Set[str] = set()
+    for folder in filter(None, (root, checkpoints_dir)):
+        for notebook_path in _iter_notebook_paths(folder):
+            referenced |= _referenced_digests(notebook_path)
+
+    removed = 0
+    for path in blobs_dir.glob("*/*"):
+        try:
+            # written or reused since we started
+            if path.name in referenced or path.stat().st_mtime >= started_at:
+                continue
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            continue
+    log.info("%s notebook outputs removed, %s in use", removed, len(referenced))
+    return removed
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command")
+    gc_parser = commands.add_parser("gc", help="removes the unused outputs")
+    gc_parser.add_argument("path", help="The state folder", type=Path)
+    gc_parser.add_argument("--checkpoints", type=Path, default=None)
+    options = parser.parse_args(args)
+
+    if options.command != "gc":
+        parser.print_help()
+        return 1
+    collect_garbage(options.path.resolve(), options.checkpoints)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Serves the state folder while it is being restored
+
+StateContentsManager answers 503 for what is not restored yet. The handlers
+that can wait for it instead are registered by this server extension
+(``jupyter_commons.contents``): the contents API, the notebook page and
+/files/ (see StateContentsManager.files_handler_class).
+"""
+import logging
+import os
+from base64 import decodebytes, encodebytes
+from pathlib import Path
+
+import nbformat
+from notebook.base.handlers import AuthenticatedFileHandler
+from notebook.notebook import handlers as notebook_handlers
+from notebook.services.contents import handlers as contents_handlers
+from notebook.services.contents.largefilemanager import LargeFileManager
+from notebook.utils import maybe_future, url_path_join
+from tornado import web
+from traitlets import default
+
+from . import blobs, readiness, restore
+
+log = logging.getLogger(__name__)
+
+
+async def _wait_until_restored(path: str) -> None:
+    rel_path = path.strip("/")
+    if readiness.is_ready() and not restore.is_pending(rel_path):
+        return
+    log.info("%s is still being restored, waiting for it", rel_path or "/")
+    await readiness.wait_until_ready()
+    await restore.wait_until_restored(rel_path)
+
+
+class _WaitUntilRestoredMixin:
+    """GET waits for the path being restored instead of answering 503"""
+
+    @web.authenticated
+    async def get(self, path="", *args, **kwargs):
+        await _wait_until_restored(path)
+        await super().get(path, *args, **kwargs)
+
+
+class WaitingContentsHandler(_WaitUntilRestoredMixin, contents_handlers.ContentsHandler):
+    pass
+
+
+class WaitingNotebookHandler(_WaitUntilRestoredMixin, notebook_handlers.NotebookHandler):
+    pass
+
+
+class StateFilesHandler(AuthenticatedFileHandler):
+    """/files/, waits for the files being restored and serves the notebooks with
+    their outputs (e.g. downloaded)"""
+
+    @web.authenticated
+    async def get(self, path, include_body=True):
+        await _wait_until_restored(path)
+        if os.path.splitext(path)[1] != ".ipynb":
+            if include_body:
+                return await super().get(path)
+            return await web.StaticFileHandler.get(self, path, include_body=False)
+
+        self.check_xsrf_cookie()
+        cm = self.contents_manager
+        if cm.is_hidden(path) and not cm.allow_hidden:
+            raise web.HTTPError(404)
+        model = await maybe_future(
+            cm.get(path, type="file", format="text", content=include_body)
+        )
+        self.set_attachment_header(model["name"])
+        self.set_header("Content-Type", "application/x-ipynb+json")
+        self.set_header("Cache-Control", "no-cache")
+        if include_body:
+            self.write(model["content"])
+        self.finish()
+
+
+class StateContentsManager(LargeFileManager):
+    """Contents of the state folder
+
+    - nothing is served before the state is restored (see readiness), nothing
+      can be changed if it could not be restored
+    - files still being restored are not reported missing but answer 503
+      (see the module docstring for the handlers waiting for them) and cannot
+      be changed, nor the folders containing them
+    - large outputs are stored aside, once, in blobs.BLOBS_DIR_NAME. The
+      notebooks are served with them, also as files (e.g. downloaded), but
+      the .ipynb on disk only refers to them
+    """
+
+    @default("files_handler_class")
+    def _files_handler_class_default(self):
+        return StateFilesHandler
+
+    @property
+    def _blobs_dir(self) -> Path:
+        return Path(self.root_dir) / blobs.BLOBS_DIR_NAME
+
+    def _rehydrate_text(self, text: str) -> str:
+        if blobs.METADATA_KEY not in text:
+            return text
+        try:
+            nb = nbformat.reads(text, as_version=nbformat.NO_CONVERT)
+        except Exception:  # pylint: disable=broad-except
+            # served as is, like any invalid notebook
+            return text
+        return nbformat.writes(blobs.rehydrate(nb, self._blobs_dir))
+
+    def _read_file(self, os_path, format):
+        # pylint: disable=redefined-builtin
+        content, format = super()._read_file(os_path, format)
+        if not os_path.endswith(".ipynb"):
+            return content, format
+        if format == "text":
+            return self._rehydrate_text(content), format
+        try:
+            text = decodebytes(content.encode("ascii")).decode("utf-8")
+        except UnicodeError:
+            return content, format
+        return encodebytes(self._rehydrate_text(text).encode("utf-8")).decode("ascii"), format
+
+    def _read_notebook(self, os_path, as_version=4):
+        nb = super()._read_notebook(os_path, as_version=as_version)
+        return blobs.rehydrate(nb, self._blobs_dir)
+
+    def _save_notebook(self, os_path, nb):
+        # NOTE: the notebook is signed before, i.e. with all its outputs
+        super()._save_notebook(os_path, blobs.externalize(nb, self._blobs_dir))
+
+    def get(self, path, content=True, type=None, format=None):
+        # pylint: disable=redefined-builtin
+        rel_path = path.strip("/")
+        # NOTE: if the restore failed, whatever was restored is served
+        restoring = not readiness.is_ready() and not readiness.has_failed()
+        if restoring or restore.is_pending(rel_path):
+            raise web.HTTPError(
+                503, f"{rel_path or '/'} is being restored, please retry later"
+            )
+        return super().get(path, content=content, type=type, format=format)
+
+    def _check_ready(self):
+        if readiness.has_failed():
+            # for good, see docker/boot_notebook.bash
+            raise web.HTTPError(
+                409, "The state could not be restored, changes cannot be saved"
+            )
+        # the restore would overwrite any change
+        if not readiness.is_ready():
+            raise web.HTTPError(503, "State is being restored, please retry later")
+
+    def _check_restored(self, *paths):
+        self._check_ready()
+        # restore_remaining would overwrite them, or restore them into a folder
+        # deleted or renamed in the meantime
+        for path in paths:
+            rel_path = path.strip("/")
+            if restore.has_pending(rel_path):
+                raise web.HTTPError(
+                    503, f"{rel_path or '/'} is being restored, please retry later"
+                )
+
+    def save(self, model, path=""):
+        self._check_restored(path)
+        return super().save(model, path)
+
+    def delete(self, path):
+        self._check_restored(path)
+        return super().delete(path)
+
+    def rename(self, old_path, new_path):
+        self._check_restored(old_path, new_path)
+        return super().rename(old_path, new_path)
+
+
+def load_jupyter_server_extension(nb_server_app):
+    """Registers the waiting handlers in place of the notebook ones"""
+    web_app = nb_server_app.web_app
+    if not isinstance(web_app.settings["contents_manager"], StateContentsManager):
+        nb_server_app.log.warning("%s is not the contents manager", StateContentsManager)
+        return
+    waiting = {
+        contents_handlers.ContentsHandler: WaitingContentsHandler,
+        notebook_handlers.NotebookHandler: WaitingNotebookHandler,
+    }
+    # NOTE: all the rules of the modules, their order matters
+    handlers = [
+        (url_path_join(web_app.settings["base_url"], pattern), waiting.get(handler, handler))
+        for module in (contents_handlers, notebook_handlers)
+        for pattern, handler in module.default_handlers
+    ]
+    web_app.add_handlers(".*$", handlers)
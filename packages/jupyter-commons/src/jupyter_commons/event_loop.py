@@ -0,0 +1,112 @@
+"""
+Keeps the tornado event loop (i.e. the UI and the kernels websockets) responsive
+
+- blocking filesystem calls are run in a small, bounded, pool of threads,
+  separate from the default executor used by the long running archiving jobs
+- LagMonitor logs where the loop is stuck whenever it does not run for longer
+  than a threshold
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+IO_MAX_WORKERS = int(os.environ.get("SIMCORE_IO_MAX_WORKERS", "4"))
+# seconds, 0 disables the monitor
+LOOP_LAG_THRESHOLD = float(os.environ.get("SIMCORE_LOOP_LAG_THRESHOLD", "0.25"))
+
+_STACK_LIMIT = 20
+
+_io_executor = ThreadPoolExecutor(
+    max_workers=IO_MAX_WORKERS, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    return await asyncio.get_event_loop().run_in_executor(
+        _io_executor, partial(func, *args, **kwargs)
+    )
+
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        log.error("background call failed", exc_info=future.exception())
+
+
+def run_blocking_in_background(func, *args, **kwargs) -> Future:
+    """Fire and forget, e.g. cleanups nobody has to wait for"""
+    future = _io_executor.submit(func, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+class LagMonitor:
+    """Reports the event loop being blocked, together with the blocking call
+
+    A coroutine beats every interval while a thread checks the beats: when
+    they stop for longer than the threshold, the stack of the loop thread
+    (i.e. the call site blocking it) is logged once per blocking episode.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.interval = max(threshold / 2, 0.01)
+        self.blocked_count = 0
+        self.max_lag = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+
+    def start(self) -> None:
+        """To be called from the thread running the loop"""
+        self._loop_thread_id = threading.get_ident()
+        asyncio.ensure_future(self._beat())
+        threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True).start()
+
+    async def _beat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - self._last_beat - self.interval
+            self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while True:
+            time.sleep(self.interval)
+            last_beat = self._last_beat
+            lag = time.monotonic() - last_beat - self.interval
+            if lag < self.threshold or last_beat == reported_beat:
+                continue
+            reported_beat = last_beat
+            self.blocked_count += 1
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                self._loop_thread_id
+            )
+            stack = "".join(traceback.format_stack(frame, limit=_STACK_LIMIT)) if frame else ""
+            log.warning("event loop blocked for more than %ss in:\n%s", round(lag, 3), stack)
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "blocked_count": self.blocked_count,
+            "max_lag": round(self.max_lag, 3),
+        }
+
+
+lag_monitor: Optional[LagMonitor] = None
+
+
+def start_lag_monitor() -> Optional[LagMonitor]:
+    global lag_monitor  # pylint: disable=global-statement
+    if LOOP_LAG_THRESHOLD > 0 and lag_monitor is None:
+        lag_monitor = LagMonitor(LOOP_LAG_THRESHOLD)
+        lag_monitor.start()
+    return lag_monitor
@@ -9,7 +9,7 @@ import time
 import zipfile
 from functools import wraps
 from pathlib import Path
-from typing import Any, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from simcore_sdk import node_ports_v2
 from simcore_sdk.node_ports_v2 import Nodeports, Port
@@ -18,6 +18,9 @@ from simcore_sdk.node_ports_v2.links import ItemConcreteValue
 
 from servicelib.archiving_utils import archive_dir, unarchive_dir, PrunableFolder
 
+from .. import bandwidth, event_loop
+from . import _liveness
+
 logger = logging.getLogger(__name__)
 
 _INPUTS_FOLDER = os.environ.get("INPUTS_FOLDER")
@@ -60,41 +63,70 @@ def run_sequentially(loop=None):
     return internal
 
 
+def _read_key_values(data_file: Path) -> Optional[Dict[str, Any]]:
+    if not data_file.exists():
+        return None
+    return json.loads(data_file.read_text())
+
+
+def _update_key_values(data_file: Path, data: Dict[str, Any]) -> Dict[str, Any]:
+    current_data = _read_key_values(data_file)
+    if current_data is not None:
+        # merge data
+        data = {**current_data, **data}
+    data_file.write_text(json.dumps(data))
+    return data
+
+
+def _list_recursively(folder: Path) -> List[Path]:
+    return list(folder.rglob("*"))
+
+
 async def get_data_from_port(port: Port) -> Tuple[Port, ItemConcreteValue]:
-    logger.info("transfer started for %s", port.key)
-    start_time = time.perf_counter()
-    ret = await port.get()
-    elapsed_time = time.perf_counter() - start_time
-    logger.info("transfer completed in %ss", elapsed_time)
-    if isinstance(ret, Path):
-        size_mb = ret.stat().st_size / 1024 / 1024
-        logger.info(
-            "%s: data size: %sMB, transfer rate %sMB/s",
-            ret.name,
-            size_mb,
-            size_mb / elapsed_time,
-        )
+    # the size of a download is only known once it is done
+    async with bandwidth.governor.transfer(bandwidth.INTERACTIVE) as transfer:
+        logger.info("transfer started for %s", port.key)
+        start_time = time.perf_counter()
+        ret = await port.get()
+        elapsed_time = time.perf_counter() - start_time
+        logger.info("transfer completed in %ss", elapsed_time)
+        if isinstance(ret, Path):
+            size_bytes = (await event_loop.run_blocking(ret.stat)).st_size
+            transfer.charge(size_bytes)
+            size_mb = size_bytes / 1024 / 1024
+            logger.info(
+                "%s: data size: %sMB, transfer rate %sMB/s",
+                ret.name,
+                size_mb,
+                size_mb / elapsed_time,
+            )
+        else:
+            transfer.charge(sys.getsizeof(ret))
     return (port, ret)
 
 
 async def set_data_to_port(port: Port, value: Optional[Any]):
-    logger.info("transfer started for %s", port.key)
-    start_time = time.perf_counter()
-    await port.set(value)
-    elapsed_time = time.perf_counter() - start_time
+    if isinstance(value, Path):
+        size_bytes = (await event_loop.run_blocking(value.stat)).st_size
+    else:
+        size_bytes = sys.getsizeof(value)
+    async with bandwidth.governor.transfer(bandwidth.PUSH, size_bytes):
+        logger.info("transfer started for %s", port.key)
+        start_time = time.perf_counter()
+        await port.set(value)
+        elapsed_time = time.perf_counter() - start_time
     logger.info("transfer completed in %ss", elapsed_time)
     if isinstance(value, Path):
-        size_bytes = value.stat().st_size
         logger.info(
             "%s: data size: %sMB, transfer rate %sMB/s",
             value.name,
             size_bytes / 1024 / 1024,
             size_bytes / 1024 / 1024 / elapsed_time,
         )
-        return size_bytes
-    return sys.getsizeof(value)
+    return size_bytes
 
 
+@_liveness.tracked_transfer("retrieve")
 async def download_data(port_keys: List[str]) -> int:
     logger.info("retrieving data from simcore...")
     start_time = time.perf_counter()
@@ -128,20 +160,26 @@ async def download_data(port_keys: List[str]) -> int:
                 downloaded_file: Optional[Path] = value
                 dest_path: Path = inputs_path / port.key
 
-                if not downloaded_file or not downloaded_file.exists():
+                if not downloaded_file or not await event_loop.run_blocking(
+                    downloaded_file.exists
+                ):
                     # the link may be empty
                     continue
 
-                transfer_bytes = transfer_bytes + downloaded_file.stat().st_size
+                transfer_bytes = (
+                    transfer_bytes
+                    + (await event_loop.run_blocking(downloaded_file.stat)).st_size
+                )
 
                 # in case of valid file, it is either uncompressed and/or moved to the final directory
                 logger.info("creating directory %s", dest_path)
-                dest_path.mkdir(exist_ok=True, parents=True)
+                await event_loop.run_blocking(dest_path.mkdir, exist_ok=True, parents=True)
                 data[port.key] = {"key": port.key, "value": str(dest_path)}
 
-                if zipfile.is_zipfile(downloaded_file):
+                if await event_loop.run_blocking(zipfile.is_zipfile, downloaded_file):
 
-                    dest_folder = PrunableFolder(dest_path)
+                    # NOTE: lists the current content of dest_path
+                    dest_folder = await event_loop.run_blocking(PrunableFolder, dest_path)
 
                     # unzip updated data to dest_path
                     logger.info("unzipping %s", downloaded_file)
@@ -149,25 +187,22 @@ async def download_data(port_keys: List[str]) -> int:
                         archive_to_extract=downloaded_file, destination_folder=dest_path
                     )
 
-                    dest_folder.prune(exclude=unarchived)
+                    await event_loop.run_blocking(dest_folder.prune, exclude=unarchived)
 
                     logger.info("all unzipped in %s", dest_path)
                 else:
                     logger.info("moving %s", downloaded_file)
                     dest_path = dest_path / Path(downloaded_file).name
-                    shutil.move(downloaded_file, dest_path)
+                    await event_loop.run_blocking(shutil.move, downloaded_file, dest_path)
                     logger.info("all moved to %s", dest_path)
             else:
                 transfer_bytes = transfer_bytes + sys.getsizeof(value)
 
     # create/update the json file with the new values
     if data:
-        data_file = inputs_path / _KEY_VALUE_FILE_NAME
-        if data_file.exists():
-            current_data = json.loads(data_file.read_text())
-            # merge data
-            data = {**current_data, **data}
-        data_file.write_text(json.dumps(data))
+        data = await event_loop.run_blocking(
+            _update_key_values, inputs_path / _KEY_VALUE_FILE_NAME, data
+        )
     stop_time = time.perf_counter()
     logger.info(
         "all data retrieved from simcore in %s seconds: %s",
@@ -178,6 +213,7 @@ async def download_data(port_keys: List[str]) -> int:
 
 
 @run_sequentially()
+@_liveness.tracked_transfer("push")
 async def upload_data(port_keys: List[str]) -> int:
     """calls to this function will get queued and invoked in sequence"""
     # pylint: disable=too-many-branches
@@ -199,13 +235,17 @@ async def upload_data(port_keys: List[str]) -> int:
         )
         if _FILE_TYPE_PREFIX in port.property_type:
             src_folder = outputs_path / port.key
-            files_and_folders_list = list(src_folder.rglob("*"))
+            files_and_folders_list = await event_loop.run_blocking(
+                _list_recursively, src_folder
+            )
 
             if not files_and_folders_list:
                 upload_tasks.append(set_data_to_port(port, None))
                 continue
 
-            if len(files_and_folders_list) == 1 and files_and_folders_list[0].is_file():
+            if len(files_and_folders_list) == 1 and await event_loop.run_blocking(
+                files_and_folders_list[0].is_file
+            ):
                 # special case, direct upload
                 upload_tasks.append(set_data_to_port(
                     port, files_and_folders_list[0]))
@@ -213,7 +253,10 @@ async def upload_data(port_keys: List[str]) -> int:
 
             # generic case let's create an archive
             # only the filtered out files will be zipped
-            tmp_file = Path(tempfile.mkdtemp()) / f"{src_folder.stem}.zip"
+            tmp_file = (
+                Path(await event_loop.run_blocking(tempfile.mkdtemp))
+                / f"{src_folder.stem}.zip"
+            )
             temp_files.append(tmp_file)
 
             zip_was_created = await archive_dir(
@@ -228,11 +271,11 @@ async def upload_data(port_keys: List[str]) -> int:
                 logger.error(
                     "Could not create zip archive, nothing will be uploaded")
         else:
-            data_file = outputs_path / _KEY_VALUE_FILE_NAME
-            if data_file.exists():
-                data = json.loads(data_file.read_text())
-                if port.key in data and data[port.key] is not None:
-                    upload_tasks.append(set_data_to_port(port, data[port.key]))
+            data = await event_loop.run_blocking(
+                _read_key_values, outputs_path / _KEY_VALUE_FILE_NAME
+            )
+            if data and data.get(port.key) is not None:
+                upload_tasks.append(set_data_to_port(port, data[port.key]))
 
     if upload_tasks:
         try:
@@ -241,7 +284,9 @@ async def upload_data(port_keys: List[str]) -> int:
         finally:
             # clean up possible compressed files
             for file_path in temp_files:
-                shutil.rmtree(file_path.parent, ignore_errors=True)
+                event_loop.run_blocking_in_background(
+                    shutil.rmtree, file_path.parent, ignore_errors=True
+                )
 
     stop_time = time.perf_counter()
     logger.info("all data uploaded to simcore in %sseconds",
@@ -0,0 +1,92 @@
+"""
+In-memory liveness of the background activities, reported by /healthz
+
+Updated by the transfers and the watcher thread, read by the health handler:
+nothing here touches the disk or the network.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Dict, Optional
+
+# the watcher thread beats every 0.5s, see watcher.start_watcher
+WATCHER_STALE_AFTER = 30.0
+
+
+@dataclass
+class TransferStats:
+    in_progress: int = 0
+    completed: int = 0
+    failed: int = 0
+    last_started_at: Optional[float] = None
+    last_completed_at: Optional[float] = None
+    last_failed_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+_lock = threading.Lock()
+_transfers: Dict[str, TransferStats] = {}
+_watcher_heartbeat: Optional[float] = None
+
+
+@contextmanager
+def transfer(kind: str):
+    """Accounts for a transfer (retrieve, push, state...) while it runs"""
+    with _lock:
+        stats = _transfers.setdefault(kind, TransferStats())
+        stats.in_progress += 1
+        stats.last_started_at = time.time()
+    try:
+        yield
+    except Exception as exc:
+        with _lock:
+            stats.failed += 1
+            stats.last_failed_at = time.time()
+            stats.last_error = str(exc) or type(exc).__name__
+        raise
+    else:
+        with _lock:
+            stats.completed += 1
+            stats.last_completed_at = time.time()
+    finally:
+        with _lock:
+            stats.in_progress -= 1
+
+
+def tracked_transfer(kind: str):
+    """Same as transfer for a whole coroutine function"""
+
+    def internal(decorated_function):
+        @wraps(decorated_function)
+        async def wrapper(*args, **kwargs):
+            with transfer(kind):
+                return await decorated_function(*args, **kwargs)
+
+        return wrapper
+
+    return internal
+
+
+def watcher_heartbeat() -> None:
+    global _watcher_heartbeat  # pylint: disable=global-statement
+    _watcher_heartbeat = time.time()
+
+
+def transfers() -> Dict[str, dict]:
+    with _lock:
+        return {kind: asdict(stats) for kind, stats in _transfers.items()}
+
+
+def watcher() -> dict:
+    """A watcher that never beat is either starting or not loaded"""
+    last_heartbeat = _watcher_heartbeat
+    if last_heartbeat is None:
+        return {"started": False, "alive": True, "seconds_since_heartbeat": None}
+    seconds_since_heartbeat = round(time.time() - last_heartbeat, 3)
+    return {
+        "started": True,
+        "alive": seconds_since_heartbeat < WATCHER_STALE_AFTER,
+        "seconds_since_heartbeat": seconds_since_heartbeat,
+    }
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from tornado.ioloop import IOLoop
+
+from .. import bandwidth, event_loop, restore, snapshots
+from . import _liveness
+
+log = logging.getLogger(__name__)
+
+_STATE_PATH = os.environ.get("SIMCORE_NODE_APP_STATE_PATH", "undefined") # typically /home/jovian/work
+
+# seconds between two snapshots, 0 disables the autosave
+AUTOSAVE_INTERVAL = float(os.environ.get("SIMCORE_STATE_AUTOSAVE_INTERVAL", "300"))
+# limits the disk reads of a snapshot to keep the notebook responsive
+AUTOSAVE_MAX_BYTES_PER_SECOND = int(
+    os.environ.get("SIMCORE_STATE_AUTOSAVE_MAX_BYTES_PER_SECOND", str(20 * 1024 * 1024))
+)
+# the chain is compacted into a new base once it has that many deltas
+AUTOSAVE_MAX_DELTAS = int(os.environ.get("SIMCORE_STATE_AUTOSAVE_MAX_DELTAS", "20"))
+
+
+async def autosave_state_forever(state_path: Path):
+    """Periodically pushes the changes tracked by the watcher as a delta snapshot"""
+    while True:
+        await asyncio.sleep(AUTOSAVE_INTERVAL)
+        if not snapshots.dirty_paths:
+            continue
+        push_status = restore.push_status()
+        if push_status not in (restore.PUSH_ALLOWED, restore.PUSH_DELTA_ONLY):
+            # same as POST /state: an incomplete folder would replace the stored state
+            log.warning("State is not (fully) restored, not autosaved")
+            continue
+        delta_only = push_status == restore.PUSH_DELTA_ONLY
+        try:
+            full = not delta_only and await event_loop.run_blocking(
+                snapshots.needs_compaction, AUTOSAVE_MAX_DELTAS
+            )
+            with _liveness.transfer("autosave"):
+                transferred_bytes = await snapshots.save_state(
+                    state_path,
+                    full=full,
+                    max_bytes_per_second=AUTOSAVE_MAX_BYTES_PER_SECOND,
+                    delta_only=delta_only,
+                    priority=bandwidth.BACKGROUND,
+                )
+            log.info("autosaved %s bytes of state", transferred_bytes)
+        except snapshots.BaseSnapshotRequired:
+            log.info("State is not completely restored, a new base cannot be autosaved yet")
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Unexpected error while autosaving state, will retry")
+
+
+def load_jupyter_server_extension(_):
+    """Called when the extension is loaded
+
+    - Starts saving state in the background
+
+    :param nb_server_app: handle to the Notebook webserver instance.
+    :type nb_server_app: NotebookWebApplication
+    """
+    if _STATE_PATH == "undefined" or AUTOSAVE_INTERVAL <= 0:
+        log.warning("State autosave is disabled")
+        return
+
+    IOLoop.current().spawn_callback(autosave_state_forever, Path(_STATE_PATH))
@@ -0,0 +1,67 @@
+import json
+import logging
+
+from notebook.base.handlers import IPythonHandler
+from notebook.utils import url_path_join
+
+from .. import bandwidth, event_loop, readiness, restore
+from . import _liveness
+
+log = logging.getLogger(__name__)
+
+
+def health_report() -> dict:
+    """Built from in-memory state only, must stay cheap under load"""
+    boot_status = readiness.current_status() or {}
+    progress, _ = restore.current_progress()
+    watcher = _liveness.watcher()
+
+    # large transfers or a slow restore do not make the service unhealthy
+    healthy = not readiness.has_failed() and watcher["alive"]
+    return {
+        "status": "ok" if healthy else "unhealthy",
+        "ready": readiness.is_ready(),
+        "boot": {
+            "phases": boot_status.get("phases", {}),
+            "failed": boot_status.get("failed"),
+        },
+        "restore": {
+            "state": progress.state,
+            "files_restored": progress.files_restored,
+            "files_total": progress.files_total,
+            "bytes_restored": progress.bytes_restored,
+            "bytes_total": progress.bytes_total,
+        },
+        "transfers": _liveness.transfers(),
+        "bandwidth": bandwidth.governor.stats(),
+        "watcher": watcher,
+        "event_loop": event_loop.lag_monitor.stats() if event_loop.lag_monitor else None,
+    }
+
+
+class HealthHandler(IPythonHandler):
+    def get(self):
+        report = health_report()
+        if report["status"] != "ok":
+            log.warning("unhealthy: %s", report)
+        self.set_header("Content-Type", "application/json")
+        self.set_status(200 if report["status"] == "ok" else 503)
+        self.finish(json.dumps(report))
+
+
+def load_jupyter_server_extension(nb_server_app):
+    """Called when the extension is loaded
+
+    - Adds API to server
+    - Starts monitoring the event loop lag
+
+    :param nb_server_app: handle to the Notebook webserver instance.
+    :type nb_server_app: NotebookWebApplication
+    """
+    web_app = nb_server_app.web_app
+    host_pattern = ".*$"
+    route_pattern = url_path_join(web_app.settings["base_url"], "/healthz")
+
+    web_app.add_handlers(host_pattern, [(route_pattern, HealthHandler)])
+
+    event_loop.start_lag_monitor()
@@ -1,33 +1,22 @@
+import asyncio
+import json
 import logging
 import os
-import tempfile
-import shutil
 from pathlib import Path
-from contextlib import contextmanager
 
 from notebook.base.handlers import IPythonHandler
 from notebook.utils import url_path_join
 
 from simcore_sdk.node_ports_v2 import exceptions
-from simcore_sdk.node_data import data_manager
 
-from servicelib.archiving_utils import archive_dir
+from .. import restore, snapshots
+from . import _liveness
 
 log = logging.getLogger(__name__)
 
 _STATE_PATH = os.environ.get("SIMCORE_NODE_APP_STATE_PATH", "undefined") # typically /home/jovian/work
 
 
-@contextmanager
-def get_temp_name(path_to_compress: Path) -> Path:
-    base_dir = Path(tempfile.mkdtemp())
-    zip_temp_name = base_dir / f"{path_to_compress.name}.zip"
-    try:
-        yield zip_temp_name
-    finally:
-        shutil.rmtree(base_dir, ignore_errors=True)
-
-
 def _state_path() -> Path:
     assert _STATE_PATH != "undefined", "SIMCORE_NODE_APP_STATE_PATH is not defined!"
     state_path = Path(_STATE_PATH)
@@ -38,24 +27,43 @@ class StateHandler(IPythonHandler):
     def initialize(self):  # pylint: disable=no-self-use
         pass
 
+    def _refuse_while_restoring(self, refuse_if_failed: bool) -> bool:
+        """Finishes the request if the state is not (completely) restored"""
+        push_status = restore.push_status()
+        if push_status == restore.PUSH_REFUSED and refuse_if_failed:
+            # pushing would replace the stored state with an incomplete one
+            log.error("State was not fully restored, refusing to push it")
+            self.set_status(409, reason="state was not fully restored")
+        elif push_status == restore.PUSH_LATER or (
+            # only the changes may be pushed, nothing pulled until the large
+            # files are restored (if restore_remaining failed, pulling retries it)
+            push_status == restore.PUSH_DELTA_ONLY
+            and not refuse_if_failed
+            and restore.current_progress()[0].state == restore.RESTORING_REMAINING
+        ):
+            self.set_header("Retry-After", "10")
+            self.set_status(503, reason="state is being restored")
+        else:
+            return False
+        self.finish()
+        return True
+
     async def post(self):
         log.info("started pushing current state to S3...")
+        if self._refuse_while_restoring(refuse_if_failed=True):
+            return
         try:
-            path_to_archive = _state_path()
-            with get_temp_name(path_to_archive) as archive_path:
-                succeeded = await archive_dir(
-                    dir_to_compress=path_to_archive,
-                    destination=archive_path,
-                    compress=False,
-                    store_relative_path=True,
+            # only what changed since the last (auto)save is pushed
+            with _liveness.transfer("state_push"):
+                await snapshots.save_state(
+                    _state_path(),
+                    delta_only=restore.push_status() == restore.PUSH_DELTA_ONLY,
                 )
-                if not succeeded:
-                    raise ValueError("There was an error while archiving")
-
-                await data_manager.push(archive_path)
-
             self.set_status(204)
-        except (exceptions.NodeportsException, ValueError) as exc:
+        except snapshots.BaseSnapshotRequired as exc:
+            self.set_header("Retry-After", "10")
+            self.set_status(503, reason=str(exc))
+        except (exceptions.NodeportsException, OSError, ValueError) as exc:
             log.exception("Unexpected error while pushing state")
             self.set_status(500, reason=str(exc))
         finally:
@@ -63,8 +71,11 @@ class StateHandler(IPythonHandler):
 
     async def get(self):
         log.info("started pulling state to S3...")
+        if self._refuse_while_restoring(refuse_if_failed=False):
+            return
         try:
-            await data_manager.pull(_state_path())
+            with _liveness.transfer("state_pull"):
+                await restore.restore_state(_state_path(), at_boot=False)
             self.set_status(204)
         except exceptions.S3InvalidPathError as exc:
             log.exception("Invalid path to S3 while retrieving state")
@@ -73,7 +84,24 @@ class StateHandler(IPythonHandler):
             log.exception("Unexpected error while retrieving state")
             self.set_status(500, reason=str(exc))
         finally:
-            self.finish("completed pulling state")
+            # NOTE: a 204 cannot have a body
+            self.finish()
+
+
+class StatePlanHandler(IPythonHandler):
+    async def get(self):
+        # dry-run: what the next POST /state would archive, per top-level folder
+        try:
+            snapshot_plan = await asyncio.get_event_loop().run_in_executor(
+                None, snapshots.plan_snapshot, _state_path()
+            )
+            self.write(json.dumps({"data": snapshot_plan}))
+            self.set_status(200)
+        except OSError as exc:
+            log.exception("Unexpected error while planning state snapshot")
+            self.set_status(500, reason=str(exc))
+        finally:
+            self.finish()
 
 
 def load_jupyter_server_extension(nb_server_app):
@@ -87,5 +115,9 @@ def load_jupyter_server_extension(nb_server_app):
     web_app = nb_server_app.web_app
     host_pattern = ".*$"
     route_pattern = url_path_join(web_app.settings["base_url"], "/state")
+    plan_route_pattern = url_path_join(web_app.settings["base_url"], "/state/plan")
 
-    web_app.add_handlers(host_pattern, [(route_pattern, StateHandler)])
+    web_app.add_handlers(
+        host_pattern,
+        [(route_pattern, StateHandler), (plan_route_pattern, StatePlanHandler)],
+    )
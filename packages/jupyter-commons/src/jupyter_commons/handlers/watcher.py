@@ -5,12 +5,14 @@ import time
 from functools import wraps
 from os.path import expanduser
 from pathlib import Path
+from typing import Optional
 
 from tornado.ioloop import IOLoop
 from watchdog.events import FileSystemEventHandler, PatternMatchingEventHandler
 from watchdog.observers import Observer
 
-from . import _input_retriever
+from .. import readiness, restore, snapshots
+from . import _input_retriever, _liveness
 
 log = logging.getLogger(__name__)
 
@@ -137,6 +139,68 @@ class WorkFolderEventHandler(PatternMatchingEventHandler):
         #    self.workdir.mkdir(parents=True, exist_ok=True)
 
 
+class DirtyPathsEventHandler(FileSystemEventHandler):
+    """Records what changes in the state folder for the next incremental snapshot"""
+
+    def __init__(self, dirty_paths: snapshots.DirtyPaths):
+        super().__init__()
+        self.dirty_paths = dirty_paths
+
+    def on_moved(self, event):
+        super().on_moved(event)
+        self.dirty_paths.mark_deleted(event.src_path)
+        self.dirty_paths.mark_changed(event.dest_path)
+
+    def on_created(self, event):
+        super().on_created(event)
+        self.dirty_paths.mark_changed(event.src_path)
+
+    def on_deleted(self, event):
+        super().on_deleted(event)
+        self.dirty_paths.mark_deleted(event.src_path)
+
+    def on_modified(self, event):
+        super().on_modified(event)
+        # a folder is modified whenever its content changes, which is reported separately
+        if not event.is_directory:
+            self.dirty_paths.mark_changed(event.src_path)
+
+
+def _track_changes(workdir: Path) -> Optional[Observer]:
+    """Records the changes of the work folder for the snapshots
+
+    Returns None if they cannot be tracked (e.g. inotify watch limit reached),
+    every snapshot is then a full one
+    """
+    log.info("Tracking changes in %s", workdir)
+    observer = Observer()
+    try:
+        observer.schedule(
+            DirtyPathsEventHandler(snapshots.dirty_paths), str(workdir), recursive=True
+        )
+        observer.start()
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Changes in %s cannot be tracked, snapshots will be full ones", workdir)
+        return None
+
+    readiness.wait_until_ready_blocking()
+    # NOTE: a restore failing early leaves no progress, i.e. looks completed
+    if readiness.has_failed() or restore.current_progress()[0].state == restore.FAILED:
+        log.error("State was not fully restored, changes will not be tracked")
+        return observer
+    try:
+        # catches up with anything changed before the observers started,
+        # the large files still being restored are not changes
+        snapshots.start_tracking(skip=restore.is_being_restored)
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Changes in %s cannot be tracked, snapshots will be full ones", workdir)
+        snapshots.dirty_paths.tracking = False
+        observer.stop()
+        observer.join()
+        return None
+    return observer
+
+
 def start_watcher(tornado_loop: IOLoop):
     # used for run
     if not OUTPUTS_FOLDER.exists():
@@ -148,6 +212,7 @@ def start_watcher(tornado_loop: IOLoop):
         tornado_loop.stop()
 
     observers = []
+    workdir = None
 
     log.info("Monitoring %s", str(OUTPUTS_FOLDER))
     outputs_event_handle = UnifyingEventHandler(loop=tornado_loop)
@@ -169,8 +234,18 @@ def start_watcher(tornado_loop: IOLoop):
         for observer in observers:
             observer.start()
 
+        if workdir is not None:
+            # NOTE: recursive, i.e. the most likely to fail on large folders: it
+            # must not take the outputs watcher down with it
+            observer3 = _track_changes(workdir)
+            if observer3 is not None:
+                observers.append(observer3)
+
         while True:
             time.sleep(0.5)
+            # a dead observer stops the heartbeat, see /healthz
+            if all(observer.is_alive() for observer in observers):
+                _liveness.watcher_heartbeat()
 
     except Exception:  # pylint: disable=broad-except
         log.exception("Watchers failed upon initialization")
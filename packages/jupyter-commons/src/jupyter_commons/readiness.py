@@ -0,0 +1,173 @@
+"""
+Readiness gate between the boot sequence and the notebook server
+
+The notebook server starts while the state is still being restored (see
+docker/boot_notebook.bash). Until the boot phases declare the service ready,
+the work folder is not served and the state cannot be pushed.
+
+Only depends on the standard library: it is also used as a (fast) CLI by the
+boot script
+
+    python -m jupyter_commons.readiness reset
+    python -m jupyter_commons.readiness run PHASE COMMAND [ARGS...]
+    python -m jupyter_commons.readiness ready
+    python -m jupyter_commons.readiness wait
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+READINESS_FILE = Path.home() / ".osparc" / "readiness.json"
+
+
+def _read() -> Optional[dict]:
+    if not READINESS_FILE.exists():
+        return None
+    return json.loads(READINESS_FILE.read_text())
+
+
+def _write(status: dict) -> None:
+    READINESS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = READINESS_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(status))
+    tmp_file.replace(READINESS_FILE)
+
+
+@contextmanager
+def _locked():
+    """Boot phases may run concurrently and update the file at the same time"""
+    READINESS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with READINESS_FILE.with_suffix(".lock").open("w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_cached_status: Tuple[Optional[int], Optional[dict]] = (None, None)
+
+
+def current_status() -> Optional[dict]:
+    """Status re-read only when the file changes, None if there is no gate"""
+    global _cached_status  # pylint: disable=global-statement
+    try:
+        mtime = READINESS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _cached_status[0]:
+        try:
+            _cached_status = (mtime, _read())
+        except ValueError:
+            # being written
+            pass
+    return _cached_status[1]
+
+
+def is_ready() -> bool:
+    status = current_status()
+    return status is None or status.get("ready", False)
+
+
+def has_failed() -> bool:
+    """True if a boot phase failed before the service got ready"""
+    status = current_status()
+    return (
+        status is not None
+        and status.get("failed") is not None
+        and not status.get("ready", False)
+    )
+
+
+async def wait_until_ready(poll_interval: float = 0.5) -> None:
+    while not is_ready() and not has_failed():
+        await asyncio.sleep(poll_interval)
+
+
+def wait_until_ready_blocking(poll_interval: float = 1.0) -> None:
+    while not is_ready() and not has_failed():
+        time.sleep(poll_interval)
+
+
+def reset() -> None:
+    with _locked():
+        _write({"ready": False, "boot_started_at": time.time(), "phases": {}, "failed": None})
+
+
+def run_phase(phase: str, command: list) -> int:
+    """Runs a boot phase and records how long it took"""
+    start_time = time.time()
+    returncode = subprocess.call(command)
+    elapsed_time = round(time.time() - start_time, 3)
+
+    with _locked():
+        status = _read() or {
+            "ready": False,
+            "boot_started_at": start_time,
+            "phases": {},
+            "failed": None,
+        }
+        status["phases"][phase] = elapsed_time
+        if returncode != 0:
+            status["failed"] = phase
+        _write(status)
+
+    if returncode != 0:
+        log.error("boot phase '%s' failed after %ss", phase, elapsed_time)
+    else:
+        log.info("boot phase '%s' completed in %ss", phase, elapsed_time)
+    return returncode
+
+
+def set_ready() -> None:
+    with _locked():
+        status = _read() or {"boot_started_at": time.time(), "phases": {}, "failed": None}
+        status["ready"] = True
+        status["ready_at"] = time.time()
+        _write(status)
+    log.info(
+        "ready %ss after boot, phases: %s",
+        round(status["ready_at"] - status["boot_started_at"], 3),
+        ", ".join(f"{name}={seconds}s" for name, seconds in status["phases"].items()),
+    )
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("reset", help="closes the gate, at the beginning of the boot")
+    run_parser = commands.add_parser("run", help="runs and times a boot phase")
+    run_parser.add_argument("phase")
+    run_parser.add_argument("phase_command", nargs=argparse.REMAINDER)
+    commands.add_parser("ready", help="opens the gate")
+    commands.add_parser("wait", help="waits for the gate, fails if a phase failed")
+    options = parser.parse_args(args)
+
+    if options.command == "reset":
+        reset()
+    elif options.command == "run":
+        return run_phase(options.phase, options.phase_command)
+    elif options.command == "ready":
+        set_ready()
+    elif options.command == "wait":
+        wait_until_ready_blocking()
+        return 1 if has_failed() else 0
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""
+Restores the service state from the snapshots pushed by snapshots.py
+
+The restore can be split in two phases so that nobody has to wait for large files:
+
+- ``restore_priority``: downloads the snapshots and extracts the notebooks and
+  the small files. Everything else is recorded as pending in the progress file.
+- ``restore_remaining``: extracts the pending files, smallest first.
+
+The progress file is the only link between both phases (which typically run in
+different processes) and whoever needs a pending file, e.g. the contents manager.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional, Tuple
+
+from simcore_sdk.node_data import data_manager
+
+from . import bandwidth, blobs, event_loop, readiness, snapshots
+from .state_ignore import StateIgnore
+
+log = logging.getLogger(__name__)
+
+_CACHE_DIR = snapshots.LOCAL_DIR / "restore"
+RESTORE_PROGRESS_FILE = snapshots.LOCAL_DIR / "restore_progress.json"
+
+# notebooks and files up to that size (in bytes) are restored first
+PRIORITY_MAX_FILE_SIZE = int(
+    os.environ.get("SIMCORE_STATE_RESTORE_PRIORITY_MAX_FILE_SIZE", str(5 * 1024 * 1024))
+)
+
+RESTORING = "restoring"
+RESTORING_REMAINING = "restoring_remaining"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# whether the state folder may be pushed, see push_status
+PUSH_ALLOWED = "allowed"
+# large files are still being restored (or could not be): only the changes (a
+# delta) may be pushed
+PUSH_DELTA_ONLY = "delta_only"
+PUSH_LATER = "later"
+# the restore failed: pushing the (incomplete) folder would replace the stored state
+PUSH_REFUSED = "refused"
+
+_CHUNK_SIZE = 1024 * 1024
+_PROGRESS_SAVE_INTERVAL = 0.5
+_RESTORING_SUFFIX = ".restoring"
+
+
+@dataclass
+class RestoreProgress:
+    state: str = COMPLETED
+    started_at: float = 0.0
+    updated_at: float = 0.0
+    files_total: int = 0
+    files_restored: int = 0
+    bytes_total: int = 0
+    bytes_restored: int = 0
+    # relative paths of the files still to be restored
+    pending: List[str] = field(default_factory=list)
+
+    @classmethod
+    def load(cls) -> "RestoreProgress":
+        """No progress file means there is nothing to restore"""
+        if not RESTORE_PROGRESS_FILE.exists():
+            return cls()
+        return cls(**json.loads(RESTORE_PROGRESS_FILE.read_text()))
+
+    def save(self) -> None:
+        self.updated_at = time.time()
+        RESTORE_PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = RESTORE_PROGRESS_FILE.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(asdict(self)))
+        tmp_file.replace(RESTORE_PROGRESS_FILE)
+
+    @property
+    def done(self) -> bool:
+        return self.state in (COMPLETED, FAILED)
+
+
+_cached_progress: Tuple[Optional[int], RestoreProgress, frozenset] = (
+    None,
+    RestoreProgress(),
+    frozenset(),
+)
+
+
+def current_progress() -> Tuple[RestoreProgress, frozenset]:
+    """Progress (and pending paths) re-read only when the file changes"""
+    global _cached_progress  # pylint: disable=global-statement
+    try:
+        mtime = RESTORE_PROGRESS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _cached_progress[0]:
+        try:
+            progress = RestoreProgress.load()
+        except (ValueError, TypeError):
+            # being written
+            return _cached_progress[1:]
+        _cached_progress = (mtime, progress, frozenset(progress.pending))
+    return _cached_progress[1:]
+
+
+def push_status() -> str:
+    """Same rules for POST /state and the autosave"""
+    progress, _ = current_progress()
+    if readiness.is_ready() and progress.state in (RESTORING_REMAINING, FAILED):
+        # the changes are tracked from readiness on, see snapshots.start_tracking,
+        # i.e. also if restore_remaining failed afterwards
+        return PUSH_DELTA_ONLY
+    if readiness.has_failed() or progress.state == FAILED:
+        return PUSH_REFUSED
+    if not readiness.is_ready() or progress.state != COMPLETED:
+        return PUSH_LATER
+    return PUSH_ALLOWED
+
+
+def is_pending(rel_path: str) -> bool:
+    progress, pending = current_progress()
+    return not progress.done and rel_path in pending
+
+
+def has_pending(rel_path: str) -> bool:
+    """The path or, for a folder, anything below it is still to be restored"""
+    progress, pending = current_progress()
+    if progress.done:
+        return False
+    if rel_path in pending:
+        return True
+    prefix = f"{rel_path}/" if rel_path else ""
+    return any(p.startswith(prefix) for p in pending)
+
+
+def is_being_restored(rel_path: str) -> bool:
+    """Pending, or the temporary file it is being extracted to"""
+    path = PurePosixPath(rel_path)
+    if path.name.startswith(".") and path.name.endswith(_RESTORING_SUFFIX):
+        rel_path = (path.parent / path.name[1 : -len(_RESTORING_SUFFIX)]).as_posix()
+    return is_pending(rel_path)
+
+
+async def wait_until_restored(rel_path: str, poll_interval: float = 0.5) -> None:
+    """Waits for a single file, no matter how much is still to be restored"""
+    while is_pending(rel_path):
+        await asyncio.sleep(poll_interval)
+
+
+def _archive_cache(state_path: Path) -> Path:
+    return _CACHE_DIR / f"{state_path.name}.zip"
+
+
+def _is_safe(rel_path: str) -> bool:
+    return not rel_path.startswith("/") and ".." not in Path(rel_path).parts
+
+
+def _extract_entry(zip_file: zipfile.ZipFile, info: zipfile.ZipInfo, state_path: Path) -> None:
+    dest_path = state_path / info.filename
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    # never expose half-written files
+    tmp_path = dest_path.with_name(f".{dest_path.name}{_RESTORING_SUFFIX}")
+    with zip_file.open(info) as src, tmp_path.open("wb") as dst:
+        shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+    # keeps the original modification time, see snapshots.start_tracking
+    mtime = time.mktime(info.date_time + (0, 0, -1))
+    os.utime(tmp_path, (mtime, mtime))
+    tmp_path.replace(dest_path)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+def _extract_entries(
+    archive_path: Path, names: List[str], state_path: Path, progress: RestoreProgress
+) -> None:
+    """Blocking: extracts names from the archive while updating the progress"""
+    last_saved = time.monotonic()
+    with zipfile.ZipFile(archive_path) as zip_file:
+        for name in names:
+            info = zip_file.getinfo(name)
+            _extract_entry(zip_file, info, state_path)
+            progress.files_restored += 1
+            progress.bytes_restored += info.file_size
+            if name in progress.pending:
+                progress.pending.remove(name)
+            if time.monotonic() - last_saved > _PROGRESS_SAVE_INTERVAL:
+                progress.save()
+                last_saved = time.monotonic()
+    progress.save()
+
+
+def _apply_deltas(
+    delta_folders: List[Path],
+    base_entries: Dict[str, zipfile.ZipInfo],
+    state_path: Path,
+) -> List[str]:
+    """Blocking: moves the delta files in place, drops what they supersede from base_entries
+
+    Returns the relative paths of the restored files
+    """
+    deleted, layers = [], {}
+    for delta_folder in delta_folders:
+        manifest = delta_folder / snapshots.DELTA_MANIFEST
+        for rel_path in json.loads(manifest.read_text())["deleted"]:
+            deleted.append(rel_path)
+            for entries in (base_entries, layers):
+                for name in [
+                    n for n in entries if n == rel_path or n.startswith(rel_path + "/")
+                ]:
+                    del entries[name]
+        for file_path in delta_folder.rglob("*"):
+            if file_path != manifest and file_path.is_file():
+                rel_path = file_path.relative_to(delta_folder).as_posix()
+                base_entries.pop(rel_path, None)
+                layers[rel_path] = file_path
+
+    for rel_path in deleted:
+        if _is_safe(rel_path):
+            _remove(state_path / rel_path)
+    for rel_path, file_path in layers.items():
+        dest_path = state_path / rel_path
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(file_path), str(dest_path))
+    return list(layers)
+
+
+def _is_notebook(info: zipfile.ZipInfo) -> bool:
+    # including their large outputs, see blobs.py
+    return info.filename.endswith(".ipynb") or info.filename.startswith(
+        blobs.BLOBS_DIR_NAME + "/"
+    )
+
+
+def _is_priority(info: zipfile.ZipInfo, priority_max_file_size: Optional[int]) -> bool:
+    return (
+        priority_max_file_size is None
+        or _is_notebook(info)
+        or info.file_size <= priority_max_file_size
+    )
+
+
+def _size_on_disk(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+async def _pull(path: Path) -> None:
+    async with bandwidth.governor.transfer(bandwidth.BACKGROUND) as transfer:
+        await data_manager.pull(path)
+        transfer.charge(
+            await asyncio.get_event_loop().run_in_executor(None, _size_on_disk, path)
+        )
+
+
+def _prepare_archive(state_path: Path) -> Path:
+    _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    archive_path = _archive_cache(state_path)
+    # NOTE: an existing file is downloaded as is, i.e. without extracting it
+    archive_path.touch()
+    return archive_path
+
+
+def _read_base(archive_path: Path) -> Tuple[Optional[str], Dict[str, zipfile.ZipInfo]]:
+    """Blocking: returns the generation of the base and its entries"""
+    with zipfile.ZipFile(archive_path) as zip_file:
+        names = zip_file.namelist()
+        generation = (
+            zip_file.read(snapshots.GENERATION_MARKER).decode().strip()
+            if snapshots.GENERATION_MARKER in names
+            else None
+        )
+        base_entries = {
+            info.filename: info
+            for info in zip_file.infolist()
+            if not info.is_dir()
+            and info.filename != snapshots.GENERATION_MARKER
+            and _is_safe(info.filename)
+        }
+    return generation, base_entries
+
+
+def _save_chain(
+    state_path: Path, generation: Optional[str], deltas: int, rel_paths: List[str]
+) -> None:
+    state_ignore = StateIgnore.load(state_path)
+    snapshots.SnapshotChain(
+        generation=generation,
+        deltas=deltas,
+        synced_at=time.time(),
+        files={
+            rel_path for rel_path in rel_paths if not state_ignore.is_ignored(rel_path)
+        },
+        stale_deltas=snapshots.SnapshotChain.load().stale_deltas,
+    ).save()
+
+
+async def restore_priority(
+    state_path: Path,
+    priority_max_file_size: Optional[int] = PRIORITY_MAX_FILE_SIZE,
+    at_boot: bool = True,
+) -> RestoreProgress:
+    """Pulls the base snapshot and the deltas of its generation and extracts the
+    notebooks and the files up to priority_max_file_size (None: all of them)
+
+    The rest is left for restore_remaining. Only a failure at boot is recorded
+    as FAILED, i.e. refuses any later push (see push_status)
+    """
+    loop = asyncio.get_event_loop()
+    progress = RestoreProgress(state=RESTORING, started_at=time.time())
+    await event_loop.run_blocking(progress.save)
+
+    try:
+        archive_path = await event_loop.run_blocking(_prepare_archive, state_path)
+        await _pull(archive_path)
+        generation, base_entries = await event_loop.run_blocking(_read_base, archive_path)
+
+        tmp_dir = await event_loop.run_blocking(tempfile.mkdtemp, dir=_CACHE_DIR)
+        try:
+            delta_folders = []
+            while generation:
+                delta_folder = Path(tmp_dir) / snapshots.delta_name(
+                    state_path, generation, len(delta_folders) + 1
+                )
+                if not await data_manager.is_file_present_in_storage(
+                    delta_folder.with_suffix(".zip")
+                ):
+                    break
+                await _pull(delta_folder)
+                delta_folders.append(delta_folder)
+                log.info("pulled delta snapshot %s", delta_folder.name)
+
+            restored_from_deltas = await loop.run_in_executor(
+                None, _apply_deltas, delta_folders, base_entries, state_path
+            )
+        finally:
+            await event_loop.run_blocking(shutil.rmtree, tmp_dir, ignore_errors=True)
+
+        # notebooks first, then from the smallest to the largest file
+        ordered = sorted(
+            base_entries.values(),
+            key=lambda i: (not _is_notebook(i), i.file_size),
+        )
+        priority = [i.filename for i in ordered if _is_priority(i, priority_max_file_size)]
+        progress.pending = [
+            i.filename for i in ordered if not _is_priority(i, priority_max_file_size)
+        ]
+        progress.files_total = len(base_entries) + len(restored_from_deltas)
+        progress.files_restored = len(restored_from_deltas)
+        progress.bytes_total = sum(i.file_size for i in base_entries.values())
+
+        await loop.run_in_executor(
+            None, _extract_entries, archive_path, priority, state_path, progress
+        )
+
+        await event_loop.run_blocking(
+            _save_chain,
+            state_path,
+            generation,
+            len(delta_folders),
+            list(base_entries) + restored_from_deltas,
+        )
+    except Exception:
+        if at_boot:
+            progress.state = FAILED
+        else:
+            # e.g. nothing stored yet: the files of the session are still there
+            # and must remain pushable
+            progress = RestoreProgress(state=COMPLETED, started_at=progress.started_at)
+        await event_loop.run_blocking(progress.save)
+        raise
+
+    if progress.pending:
+        progress.state = RESTORING_REMAINING
+    else:
+        progress.state = COMPLETED
+        await event_loop.run_blocking(archive_path.unlink)
+    await event_loop.run_blocking(progress.save)
+    log.info(
+        "restored %s/%s files of %s, %s pending",
+        progress.files_restored,
+        progress.files_total,
+        state_path,
+        len(progress.pending),
+    )
+    return progress
+
+
+async def restore_remaining(state_path: Path) -> RestoreProgress:
+    """Extracts the files left pending by restore_priority"""
+    progress = await event_loop.run_blocking(RestoreProgress.load)
+    if progress.state != RESTORING_REMAINING:
+        return progress
+
+    archive_path = _archive_cache(state_path)
+    try:
+        await asyncio.get_event_loop().run_in_executor(
+            None, _extract_entries, archive_path, list(progress.pending), state_path, progress
+        )
+    except Exception:
+        progress.state = FAILED
+        await event_loop.run_blocking(progress.save)
+        raise
+
+    progress.state = COMPLETED
+    await event_loop.run_blocking(progress.save)
+    await event_loop.run_blocking(archive_path.unlink)
+    log.info(
+        "restored %s in %ss", state_path, round(time.time() - progress.started_at, 1)
+    )
+    return progress
+
+
+async def restore_state(state_path: Path, at_boot: bool = True) -> RestoreProgress:
+    """Restores everything at once"""
+    return await restore_priority(state_path, priority_max_file_size=None, at_boot=at_boot)
+
+
+def mark_nothing_to_restore() -> None:
+    RestoreProgress(state=COMPLETED, started_at=time.time()).save()
+
@@ -0,0 +1,483 @@
+"""
+Incremental snapshots of the service state (i.e. SIMCORE_NODE_APP_STATE_PATH)
+
+A snapshot chain consists of a *base* archive, ``{state}.zip`` as pushed so far by
+``POST /state``, followed by *delta* archives ``{state}-delta-{generation}-{n}.zip``
+containing only the paths that changed since the previous snapshot (plus the
+list of deleted paths).
+
+Every base carries a generation marker: deltas are applied on restore only if
+they belong to the same generation as the base, i.e. a delta of an older chain
+is never applied on top of a newer base.
+
+NOTE: simcore_sdk cannot delete from the storage, i.e. the deltas of the older
+chains are left behind once a new base is pushed. Their names are kept in the
+chain file (``stale_deltas``, also reported by ``GET /state/plan``) for them to
+be cleaned up.
+
+Changes are tracked in ``dirty_paths``, which is fed by the watcher extension.
+Restoring a chain is done in restore.py. Paths excluded by the ``.stateignore`` rules are neither tracked nor archived.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from simcore_sdk.node_data import data_manager
+
+from . import bandwidth, event_loop
+from .state_ignore import (
+    STATE_IGNORE_FILE_NAME,
+    StateIgnore,
+    is_too_large,
+    plan,
+    walk_state,
+)
+
+log = logging.getLogger(__name__)
+
+# local bookkeeping, kept outside of the state folder
+LOCAL_DIR = Path.home() / ".osparc"
+_CHAIN_FILE = LOCAL_DIR / "snapshot_chain.json"
+
+GENERATION_MARKER = ".osparc_snapshot"
+DELTA_MANIFEST = ".osparc_delta.json"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def get_temp_name(path_to_compress: Path) -> Path:
+    base_dir = Path(tempfile.mkdtemp())
+    zip_temp_name = base_dir / f"{path_to_compress.name}.zip"
+    try:
+        yield zip_temp_name
+    finally:
+        # removing a large archive blocks, nobody has to wait for it
+        event_loop.run_blocking_in_background(shutil.rmtree, base_dir, ignore_errors=True)
+
+
+class DirtyPaths:
+    """Thread-safe record of the paths changed since the last snapshot
+
+    Paths are stored relative to ``root``. Events are produced by watchdog
+    threads and consumed in the tornado loop. Nothing is recorded before
+    start_tracking, e.g. while the state is being restored, and nothing about
+    the paths ``skip`` returns True for, e.g. the large files restored afterwards.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.tracking = False
+        self.skip: Callable[[str], bool] = lambda rel_path: False
+        self.state_ignore = StateIgnore.load(root)
+        # paths excluded so far might have to be stored from now on
+        self.rules_changed = False
+        self._lock = threading.Lock()
+        self._changed: Set[str] = set()
+        self._deleted: Set[str] = set()
+
+    def _relative(self, path: str) -> Optional[str]:
+        try:
+            rel_path = Path(path).resolve().relative_to(self.root).as_posix()
+        except ValueError:
+            return None
+        if rel_path == "." or rel_path == GENERATION_MARKER or self.skip(rel_path):
+            return None
+        if rel_path == STATE_IGNORE_FILE_NAME:
+            self.state_ignore = StateIgnore.load(self.root)
+            self.rules_changed = True
+        elif self.state_ignore.is_ignored(rel_path):
+            return None
+        return rel_path
+
+    def mark_changed(self, path: str) -> None:
+        if not self.tracking:
+            return
+        rel_path = self._relative(path)
+        if rel_path is None:
+            return
+        with self._lock:
+            self._deleted.discard(rel_path)
+            self._changed.add(rel_path)
+
+    def mark_deleted(self, path: str) -> None:
+        if not self.tracking:
+            return
+        rel_path = self._relative(path)
+        if rel_path is None:
+            return
+        prefix = rel_path + "/"
+        with self._lock:
+            self._changed = {
+                p for p in self._changed if p != rel_path and not p.startswith(prefix)
+            }
+            self._deleted.add(rel_path)
+
+    def drain(self) -> Tuple[Set[str], Set[str]]:
+        """Returns and forgets (changed, deleted) paths"""
+        with self._lock:
+            changed, deleted = self._changed, self._deleted
+            self._changed, self._deleted = set(), set()
+        return changed, deleted
+
+    def restore(self, changed: Set[str], deleted: Set[str]) -> None:
+        """Puts back drained paths (e.g. after a failed push) unless superseded"""
+        with self._lock:
+            self._deleted |= {p for p in deleted if p not in self._changed}
+            self._changed |= {p for p in changed if p not in self._deleted}
+
+    def pending(self) -> Tuple[int, int]:
+        """Number of changed and deleted paths since the last snapshot"""
+        with self._lock:
+            return len(self._changed), len(self._deleted)
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return bool(self._changed or self._deleted)
+
+
+dirty_paths = DirtyPaths(
+    root=Path(os.environ.get("SIMCORE_NODE_APP_STATE_PATH", "undefined")).resolve()
+)
+
+
+@dataclass
+class SnapshotChain:
+    """What the remote state looks like, as far as this container knows"""
+
+    generation: Optional[str] = None
+    deltas: int = 0
+    # time at which the state folder was last in sync with the remote
+    synced_at: float = 0.0
+    files: Set[str] = field(default_factory=set)
+    # deltas of older chains, still in the storage
+    stale_deltas: List[str] = field(default_factory=list)
+
+    @classmethod
+    def load(cls) -> "SnapshotChain":
+        if not _CHAIN_FILE.exists():
+            return cls()
+        try:
+            data = json.loads(_CHAIN_FILE.read_text())
+            return cls(
+                generation=data["generation"],
+                deltas=data["deltas"],
+                synced_at=data["synced_at"],
+                files=set(data["files"]),
+                stale_deltas=data.get("stale_deltas", []),
+            )
+        except (ValueError, KeyError):
+            log.warning("Invalid %s, starting a new snapshot chain", _CHAIN_FILE)
+            return cls()
+
+    def save(self) -> None:
+        LOCAL_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = _CHAIN_FILE.with_suffix(".tmp")
+        tmp_file.write_text(
+            json.dumps(
+                {
+                    "generation": self.generation,
+                    "deltas": self.deltas,
+                    "synced_at": self.synced_at,
+                    "files": sorted(self.files),
+                    "stale_deltas": self.stale_deltas,
+                }
+            )
+        )
+        tmp_file.replace(_CHAIN_FILE)
+
+
+class _RateLimiter:
+    """Blocking limiter for the bytes read while archiving (None: unlimited)"""
+
+    def __init__(self, max_bytes_per_second: Optional[int]):
+        self._rate = max_bytes_per_second
+        self._start = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, num_bytes: int) -> None:
+        if not self._rate:
+            return
+        self._consumed += num_bytes
+        ahead = self._consumed / self._rate - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _list_files(
+    root: Path, state_ignore: StateIgnore, rel_paths: Optional[Set[str]] = None
+) -> List[str]:
+    """Files to store under root or, if given, under the rel_paths (files or folders)"""
+    if rel_paths is None:
+        return [f.rel_path for f in walk_state(root, state_ignore)]
+
+    files = []
+    for rel_path in sorted(rel_paths):
+        path = root / rel_path
+        if path.is_dir():
+            files += [f.rel_path for f in walk_state(root, state_ignore, folder=path)]
+        elif path.is_file() and not state_ignore.is_ignored(rel_path):
+            try:
+                if not is_too_large(path.stat().st_size):
+                    files.append(rel_path)
+            except FileNotFoundError:
+                continue
+    return files
+
+
+def _write_archive(
+    root: Path,
+    destination: Path,
+    rel_paths: Optional[Set[str]],
+    extra_entries: Dict[str, str],
+    max_bytes_per_second: Optional[int],
+) -> Tuple[Set[str], int]:
+    """Blocking: stores files (uncompressed, relative to root) in a zip archive
+
+    Returns the archived relative paths and their total size
+    """
+    limiter = _RateLimiter(max_bytes_per_second)
+    archived: Set[str] = set()
+    total_bytes = 0
+    with zipfile.ZipFile(destination, "w", zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+        for arcname in _list_files(root, StateIgnore.load(root), rel_paths):
+            if arcname == GENERATION_MARKER:
+                continue
+            file_path = root / arcname
+            try:
+                zip_info = zipfile.ZipInfo.from_file(file_path, arcname)
+                with file_path.open("rb") as src, zip_file.open(
+                    zip_info, "w", force_zip64=True
+                ) as dst:
+                    for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+                        limiter.consume(len(chunk))
+                        dst.write(chunk)
+                        total_bytes += len(chunk)
+            except FileNotFoundError:
+                # removed while archiving, the watcher reports its deletion
+                continue
+            archived.add(arcname)
+        for name, content in extra_entries.items():
+            zip_file.writestr(name, content)
+    return archived, total_bytes
+
+
+def delta_name(state_path: Path, generation: str, number: int) -> str:
+    # NOTE: no dots, data_manager uses the stem to name folder archives
+    return "{}-delta-{}-{:04d}".format(
+        state_path.name.replace(".", "_"), generation, number
+    )
+
+
+_lock = asyncio.Lock()
+
+
+class BaseSnapshotRequired(Exception):
+    """Only a delta may be pushed but the chain needs a new base"""
+
+
+async def _push_archive(archive_path: Path, priority: str) -> None:
+    archive_bytes = (await event_loop.run_blocking(archive_path.stat)).st_size
+    async with bandwidth.governor.transfer(priority, archive_bytes):
+        await data_manager.push(archive_path)
+
+
+def needs_compaction(max_deltas: int) -> bool:
+    return SnapshotChain.load().deltas >= max_deltas
+
+
+async def _push_base(
+    state_path: Path,
+    chain: SnapshotChain,
+    max_bytes_per_second: Optional[int],
+    priority: str,
+) -> int:
+    generation = uuid.uuid4().hex
+    # anything changing from now on will go into the next delta
+    drained = dirty_paths.drain()
+    rules_changed, dirty_paths.rules_changed = dirty_paths.rules_changed, False
+    synced_at = time.time()
+    try:
+        with get_temp_name(state_path) as archive_path:
+            archived, total_bytes = await asyncio.get_event_loop().run_in_executor(
+                None,
+                _write_archive,
+                state_path,
+                archive_path,
+                None,
+                {GENERATION_MARKER: generation},
+                max_bytes_per_second,
+            )
+            await _push_archive(archive_path, priority)
+    except Exception:
+        dirty_paths.restore(*drained)
+        dirty_paths.rules_changed = dirty_paths.rules_changed or rules_changed
+        raise
+
+    superseded = [
+        delta_name(state_path, chain.generation, number)
+        for number in range(1, chain.deltas + 1)
+    ]
+    await event_loop.run_blocking(
+        SnapshotChain(
+            generation=generation,
+            deltas=0,
+            synced_at=synced_at,
+            files=archived,
+            stale_deltas=chain.stale_deltas + superseded,
+        ).save
+    )
+    log.info("pushed base snapshot %s with %s bytes", generation, total_bytes)
+    if superseded:
+        log.warning(
+            "%s deltas of the previous chain are left in the storage: %s",
+            len(superseded),
+            ", ".join(superseded),
+        )
+    return total_bytes
+
+
+async def _push_delta(
+    state_path: Path,
+    chain: SnapshotChain,
+    max_bytes_per_second: Optional[int],
+    priority: str,
+) -> int:
+    changed, deleted = dirty_paths.drain()
+    synced_at = time.time()
+    if not changed and not deleted:
+        log.info("state unchanged since last snapshot, nothing to push")
+        return 0
+
+    number = chain.deltas + 1
+    name = delta_name(state_path, chain.generation, number)
+    try:
+        with get_temp_name(Path(name)) as archive_path:
+            archived, total_bytes = await asyncio.get_event_loop().run_in_executor(
+                None,
+                _write_archive,
+                state_path,
+                archive_path,
+                changed,
+                {DELTA_MANIFEST: json.dumps({"deleted": sorted(deleted)})},
+                max_bytes_per_second,
+            )
+            await _push_archive(archive_path, priority)
+    except Exception:
+        dirty_paths.restore(changed, deleted)
+        raise
+
+    files = {
+        f
+        for f in chain.files
+        if not any(f == d or f.startswith(d + "/") for d in deleted)
+    }
+    await event_loop.run_blocking(
+        SnapshotChain(
+            generation=chain.generation,
+            deltas=number,
+            synced_at=synced_at,
+            files=files | archived,
+            stale_deltas=chain.stale_deltas,
+        ).save
+    )
+    log.info(
+        "pushed delta snapshot %s: %s paths changed (%s bytes), %s deleted",
+        name,
+        len(archived),
+        total_bytes,
+        len(deleted),
+    )
+    return total_bytes
+
+
+async def save_state(
+    state_path: Path,
+    full: bool = False,
+    max_bytes_per_second: Optional[int] = None,
+    delta_only: bool = False,
+    priority: str = bandwidth.PUSH,
+) -> int:
+    """Pushes a snapshot of the state folder and returns the archived bytes
+
+    A delta is pushed whenever the changes are being tracked and a chain
+    exists, otherwise (or if full) the whole folder is pushed as a new base.
+    With delta_only (e.g. while large files are still being restored), raises
+    BaseSnapshotRequired instead of pushing a base. The archive is pushed in
+    the priority class of the bandwidth governor, e.g. BACKGROUND for the
+    autosave, while the platform waits for POST /state.
+    """
+    async with _lock:
+        chain = await event_loop.run_blocking(SnapshotChain.load)
+        if (
+            full
+            or not dirty_paths.tracking
+            or dirty_paths.rules_changed
+            or chain.generation is None
+        ):
+            if delta_only:
+                raise BaseSnapshotRequired(f"{state_path} is not completely restored")
+            return await _push_base(state_path, chain, max_bytes_per_second, priority)
+        return await _push_delta(state_path, chain, max_bytes_per_second, priority)
+
+
+def start_tracking(skip: Optional[Callable[[str], bool]] = None) -> None:
+    """Blocking: catches up with changes done while nobody was tracking
+
+    Compares the state folder against the last known snapshot (by path and
+    modification time) and starts accepting events in dirty_paths, except for
+    the paths skip returns True for (e.g. still being restored)
+    """
+    chain = SnapshotChain.load()
+    root = dirty_paths.root
+    # the rules might have been restored in the meantime
+    dirty_paths.state_ignore = StateIgnore.load(root)
+    if skip is not None:
+        dirty_paths.skip = skip
+    dirty_paths.tracking = True
+    if chain.generation is not None:
+        present = set()
+        for rel_path in _list_files(root, dirty_paths.state_ignore):
+            file_path = root / rel_path
+            present.add(rel_path)
+            try:
+                modified = file_path.stat().st_mtime > chain.synced_at
+            except FileNotFoundError:
+                continue
+            if modified or rel_path not in chain.files:
+                dirty_paths.mark_changed(str(file_path))
+        for rel_path in chain.files - present:
+            dirty_paths.mark_deleted(str(root / rel_path))
+    log.info("tracking changes in %s", root)
+
+
+def plan_snapshot(state_path: Path) -> dict:
+    """Blocking: dry-run of the next snapshot, nothing gets archived"""
+    stored, skipped = plan(state_path, StateIgnore.load(state_path))
+    changed, deleted = dirty_paths.pending()
+    chain = SnapshotChain.load()
+    incremental = (
+        dirty_paths.tracking
+        and not dirty_paths.rules_changed
+        and chain.generation is not None
+    )
+    return {
+        "next_snapshot": "delta" if incremental else "base",
+        "pending_changes": {"changed": changed, "deleted": deleted},
+        "stored": stored,
+        "skipped": skipped,
+        "stored_bytes": sum(s["bytes"] for s in stored.values()),
+        "skipped_bytes": sum(s["bytes"] for s in skipped.values()),
+        "stale_deltas": chain.stale_deltas,
+    }
@@ -0,0 +1,163 @@
+"""
+Rules to exclude paths from the state snapshots
+
+Patterns follow a subset of the .gitignore syntax and are read from the
+``.stateignore`` file at the root of the state folder, on top of DEFAULT_RULES:
+
+- blank lines and lines starting with ``#`` are skipped
+- ``!pattern`` re-includes what a previous pattern excluded
+- ``pattern/`` only matches folders (and therefore everything below them)
+- a pattern containing a ``/`` is matched against the path relative to the root,
+  otherwise against the name of the file or folder at any depth
+- the last matching pattern wins
+"""
+import logging
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+STATE_IGNORE_FILE_NAME = ".stateignore"
+
+DEFAULT_RULES = [
+    # re-downloaded from the input ports
+    "/inputs/",
+    # already pushed to the output ports
+    "/outputs/",
+    # caches and scratch files
+    "__pycache__/",
+    ".ipynb_checkpoints/",
+    ".cache/",
+    ".Trash-*/",
+    "*.py[cod]",
+    "*.swp",
+    "*.tmp",
+]
+
+# files above that size (in bytes) are never stored, 0 disables the limit
+MAX_FILE_SIZE = int(os.environ.get("SIMCORE_STATE_MAX_FILE_SIZE", "0"))
+
+
+class _Rule(NamedTuple):
+    pattern: str
+    negated: bool
+    only_dirs: bool
+    anchored: bool
+
+    @classmethod
+    def parse(cls, line: str) -> "_Rule":
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        only_dirs = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        return cls(line.lstrip("/"), negated, only_dirs, anchored)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        if self.only_dirs and not is_dir:
+            return False
+        if self.anchored:
+            return fnmatchcase(rel_path, self.pattern)
+        return fnmatchcase(rel_path.rsplit("/", 1)[-1], self.pattern)
+
+
+class StateIgnore:
+    def __init__(self, lines: List[str]):
+        self.rules = [
+            _Rule.parse(line.strip())
+            for line in lines
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+    @classmethod
+    def load(cls, root: Path) -> "StateIgnore":
+        lines = list(DEFAULT_RULES)
+        rules_file = root / STATE_IGNORE_FILE_NAME
+        if rules_file.is_file():
+            lines += rules_file.read_text().splitlines()
+        return cls(lines)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for rule in self.rules:
+            if rule.matches(rel_path, is_dir):
+                ignored = not rule.negated
+        return ignored
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        """True if the path, or any of its parent folders, is excluded"""
+        parts = rel_path.split("/")
+        for i in range(1, len(parts)):
+            if self.matches("/".join(parts[:i]), is_dir=True):
+                return True
+        return self.matches(rel_path, is_dir)
+
+
+class StateFile(NamedTuple):
+    rel_path: str
+    size: int
+    ignored: bool
+
+
+def is_too_large(size: int) -> bool:
+    return 0 < MAX_FILE_SIZE < size
+
+
+def walk_state(
+    root: Path,
+    state_ignore: StateIgnore,
+    include_ignored: bool = False,
+    folder: Optional[Path] = None,
+) -> Iterator[StateFile]:
+    """Blocking: lists the files under root (or one of its folders)
+
+    The ignored ones are skipped unless requested
+    """
+
+    def _walk(folder: str, folder_ignored: bool) -> Iterator[StateFile]:
+        try:
+            entries = sorted(os.scandir(folder), key=lambda e: e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            rel_path = Path(entry.path).relative_to(root).as_posix()
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                ignored = folder_ignored or state_ignore.matches(rel_path, is_dir)
+                if ignored and not include_ignored:
+                    continue
+                if is_dir:
+                    yield from _walk(entry.path, ignored)
+                elif entry.is_file():
+                    size = entry.stat().st_size
+                    ignored = ignored or is_too_large(size)
+                    if not ignored or include_ignored:
+                        yield StateFile(rel_path, size, ignored)
+            except FileNotFoundError:
+                # removed while walking
+                continue
+
+    folder_ignored = folder is not None and state_ignore.is_ignored(
+        folder.relative_to(root).as_posix(), is_dir=True
+    )
+    if include_ignored or not folder_ignored:
+        yield from _walk(str(folder or root), folder_ignored)
+
+
+def plan(root: Path, state_ignore: StateIgnore) -> Tuple[dict, dict]:
+    """Blocking: size of what a full snapshot would store/skip per top-level entry
+
+    Returns (stored, skipped) as {top-level name: {"files": n, "bytes": n}}
+    """
+    stored, skipped = {}, {}
+    for state_file in walk_state(root, state_ignore, include_ignored=True):
+        top_level = state_file.rel_path.split("/", 1)[0]
+        summary = (skipped if state_file.ignored else stored).setdefault(
+            top_level, {"files": 0, "bytes": 0}
+        )
+        summary["files"] += 1
+        summary["bytes"] += state_file.size
+    return stored, skipped
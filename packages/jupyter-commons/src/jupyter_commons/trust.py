@@ -0,0 +1,196 @@
+"""
+Trusts (i.e. signs) the notebooks in the state folder
+
+Replaces ``jupyter trust`` over every notebook at every boot:
+
+- the signatures database and secret are kept with the state (TRUST_DATA_DIR,
+  also used by the notebook server, see docker/boot_notebook.bash)
+- an index of the signed notebooks (modification time, size, hash and
+  signature) is kept next to them so that only new or modified notebooks, or
+  those whose signature is missing from the database, are signed. A restore
+  resets the modification times (zip archives have a 2 seconds resolution):
+  notebooks of the same size are then hashed, not parsed and signed again
+- notebooks are read and signed in parallel
+
+    Usage python -m jupyter_commons.trust PATH
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import nbformat
+from nbformat.sign import NotebookNotary
+
+from . import blobs
+
+log = logging.getLogger(__name__)
+
+TRUST_DATA_DIR_NAME = ".jupyter_trust"
+_INDEX_FILE_NAME = "trust_index.json"
+
+# not worth a process pool below that
+_MIN_PARALLEL_NOTEBOOKS = 4
+
+_SKIPPED_TOP_LEVEL_FOLDERS = {"inputs", "outputs"}
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def trust_data_dir(state_path: Path) -> Path:
+    return state_path / TRUST_DATA_DIR_NAME
+
+
+def _iter_notebooks(state_path: Path) -> Iterator[Tuple[str, os.stat_result]]:
+    for folder, dirnames, filenames in os.walk(state_path):
+        is_top_level = Path(folder) == state_path
+        # hidden folders include .ipynb_checkpoints, the trust data and the blobs
+        dirnames[:] = [
+            d
+            for d in dirnames
+            if not d.startswith(".")
+            and not (is_top_level and d in _SKIPPED_TOP_LEVEL_FOLDERS)
+        ]
+        for filename in filenames:
+            if filename.endswith(".ipynb"):
+                path = Path(folder) / filename
+                try:
+                    yield path.relative_to(state_path).as_posix(), path.stat()
+                except FileNotFoundError:
+                    continue
+
+
+def _compute_signature(
+    path: Path, secret: bytes, blobs_dir: Path
+) -> Tuple[str, Optional[str]]:
+    """Returns the sha256 of the file and the notebook signature (None if invalid)"""
+    content = path.read_bytes()
+    try:
+        notebook = nbformat.reads(
+            content.decode("utf-8"), as_version=nbformat.NO_CONVERT
+        )
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Could not read notebook %s, will not be trusted", path)
+        return hashlib.sha256(content).hexdigest(), None
+    # signed as served by the contents manager, i.e. with all the outputs
+    blobs.rehydrate(notebook, blobs_dir)
+    signature = NotebookNotary(secret=secret).compute_signature(notebook)
+    return hashlib.sha256(content).hexdigest(), signature
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_unchanged(path: Path, stat: os.stat_result, entry: dict) -> bool:
+    if entry["size"] != stat.st_size:
+        return False
+    if entry["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    try:
+        return _sha256(path) == entry["sha256"]
+    except FileNotFoundError:
+        return False
+
+
+def _load_index(index_file: Path) -> Dict[str, dict]:
+    if not index_file.exists():
+        return {}
+    try:
+        return json.loads(index_file.read_text())
+    except ValueError:
+        log.warning("Invalid %s, all notebooks will be signed", index_file)
+        return {}
+
+
+def trust_notebooks(state_path: Path, max_workers: int = None) -> int:
+    """Signs new and modified notebooks, returns how many were signed"""
+    start_time = time.perf_counter()
+    data_dir = trust_data_dir(state_path)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    notary = NotebookNotary(data_dir=str(data_dir))
+    index_file = data_dir / _INDEX_FILE_NAME
+    index = _load_index(index_file)
+
+    new_index, candidates = {}, []
+    for rel_path, stat in _iter_notebooks(state_path):
+        entry = index.get(rel_path)
+        if (
+            entry
+            and entry.get("signature")
+            # e.g. the database was lost or recreated
+            and notary.store.check_signature(entry["signature"], notary.algorithm)
+            and _is_unchanged(state_path / rel_path, stat, entry)
+        ):
+            new_index[rel_path] = {**entry, "mtime_ns": stat.st_mtime_ns}
+        else:
+            candidates.append((rel_path, stat))
+
+    paths = [state_path / rel_path for rel_path, _ in candidates]
+    secret = notary.secret
+    blobs_dir = state_path / blobs.BLOBS_DIR_NAME
+    results: List[Tuple[str, Optional[str]]] = []
+    if len(paths) < _MIN_PARALLEL_NOTEBOOKS:
+        results = [_compute_signature(path, secret, blobs_dir) for path in paths]
+    elif paths:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(
+                pool.map(
+                    _compute_signature,
+                    paths,
+                    [secret] * len(paths),
+                    [blobs_dir] * len(paths),
+                )
+            )
+
+    signed = 0
+    for (rel_path, stat), (sha256, signature) in zip(candidates, results):
+        if signature is None:
+            continue
+        if not notary.store.check_signature(signature, notary.algorithm):
+            notary.store.store_signature(signature, notary.algorithm)
+            signed += 1
+        new_index[rel_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "signature": signature,
+        }
+
+    tmp_file = index_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(new_index))
+    tmp_file.replace(index_file)
+    log.info(
+        "%s notebooks: %s checked, %s signed in %ss",
+        len(new_index),
+        len(candidates),
+        signed,
+        round(time.perf_counter() - start_time, 3),
+    )
+    return signed
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="The state folder", type=Path)
+    parser.add_argument(
+        "--max-workers", type=int, default=None, help="defaults to the number of cores"
+    )
+    options = parser.parse_args(args)
+    trust_notebooks(options.path.resolve(), max_workers=options.max_workers)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Runs voila with a pool of pre-warmed kernels
+
+A cold voila starts a kernel and executes the whole notebook for every visitor.
+With preheated kernels (voila >= 0.3), a pool of kernels has already executed
+the notebook and rendered it, so visitors get the cached render right away.
+
+That render is only valid for the notebook and the inputs it was executed
+with: once the notebook or the content of the inputs folder changed and
+settled, the launcher starts another voila (i.e. a new pool) on another port.
+The port served to the visitors is a TCP proxy, switched over to the new voila
+once it accepts connections. The sessions already open stay on the previous
+voila until they are closed or for DRAIN_TIMEOUT at most.
+
+Only depends on the standard library, voila might live in another environment
+
+    python -m jupyter_commons.voila_launcher NOTEBOOK --inputs FOLDER --port PORT -- [VOILA ARGS...]
+"""
+import argparse
+import hashlib
+import logging
+import os
+import selectors
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get("SIMCORE_VOILA_POOL_SIZE", "1"))
+# seconds between two checks of the notebook and the inputs
+POLL_INTERVAL = float(os.environ.get("SIMCORE_VOILA_POLL_INTERVAL", "5"))
+# seconds the notebook and the inputs have to stay unchanged, a few polls
+SETTLE_TIME = float(os.environ.get("SIMCORE_VOILA_SETTLE_TIME", "15"))
+# seconds the previous voila serves the sessions already open
+DRAIN_TIMEOUT = float(os.environ.get("SIMCORE_VOILA_DRAIN_TIMEOUT", "600"))
+
+_PREHEAT_MIN_VERSION = (0, 3)
+_STOP_TIMEOUT = 10
+_READY_TIMEOUT = 120
+_READY_CHECK_INTERVAL = 0.5
+_BUFFER_SIZE = 64 * 1024
+_VOILA_HOST = "127.0.0.1"
+
+
+def fingerprint(notebook: Path, inputs_folder: Optional[Path]) -> str:
+    """Content of the notebook, size and modification time of the inputs"""
+    digest = hashlib.sha256()
+    try:
+        digest.update(notebook.read_bytes())
+    except FileNotFoundError:
+        pass
+    if inputs_folder is None:
+        return digest.hexdigest()
+    for parent, dirnames, filenames in os.walk(inputs_folder):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(parent) / filename
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # being replaced, the next check will catch it
+                continue
+            relative_path = path.relative_to(inputs_folder)
+            digest.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return digest.hexdigest()
+
+
+def _parse_version(version: str) -> tuple:
+    parts = []
+    for part in version.split(".")[:2]:
+        digits = "".join(c for c in part if c.isdigit())
+        parts.append(int(digits or 0))
+    return tuple(parts)
+
+
+def voila_supports_preheat(voila: str = "voila") -> bool:
+    try:
+        version = subprocess.run(
+            [voila, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return _parse_version(version) >= _PREHEAT_MIN_VERSION
+
+
+def voila_command(
+    notebook: Path, voila_args: List[str], port: int, pool_size: int, preheat: bool
+) -> List[str]:
+    # only reachable through the proxy
+    command = [
+        "voila",
+        str(notebook),
+        *voila_args,
+        f"--Voila.ip={_VOILA_HOST}",
+        f"--Voila.port={port}",
+    ]
+    if preheat and pool_size > 0:
+        command += [
+            "--VoilaConfiguration.preheat_kernel=True",
+            f"--VoilaConfiguration.default_pool_size={pool_size}",
+        ]
+    return command
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((_VOILA_HOST, 0))
+        return sock.getsockname()[1]
+
+
+class ChangeDebouncer:
+    """Reports a new fingerprint once it stayed the same for settle_time"""
+
+    def __init__(self, current: str, settle_time: float):
+        self.current = self.pending = current
+        self.settle_time = settle_time
+        self._pending_since = 0.0
+
+    def settled(self, latest: str, now: float) -> bool:
+        if latest != self.pending:
+            # e.g. inputs still being retrieved: waits until they settle
+            self.pending, self._pending_since = latest, now
+            return False
+        if latest == self.current or now - self._pending_since < self.settle_time:
+            return False
+        self.current = latest
+        return True
+
+
+def _pipe(client: socket.socket, backend: socket.socket) -> None:
+    peers = {client: backend, backend: client}
+    with selectors.DefaultSelector() as selector:
+        for sock in peers:
+            selector.register(sock, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = key.fileobj.recv(_BUFFER_SIZE)
+                if data:
+                    peers[key.fileobj].sendall(data)
+                    continue
+                # half-closed, the other way might still be sending
+                selector.unregister(key.fileobj)
+                peers[key.fileobj].shutdown(socket.SHUT_WR)
+
+
+class _ProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        port = self.server.open_connection()
+        try:
+            with socket.create_connection((_VOILA_HOST, port)) as backend:
+                _pipe(self.request, backend)
+        except OSError as exc:
+            log.debug("connection to voila on port %s closed: %s", port, exc)
+        finally:
+            self.server.close_connection(port)
+
+
+class VoilaProxy(socketserver.ThreadingTCPServer):
+    """Forwards the connections to the port of the current voila"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int, voila_port: int):
+        super().__init__(("", port), _ProxyHandler)
+        self.voila_port = voila_port
+        self._lock = threading.Lock()
+        self._connections = Counter()
+
+    def switch(self, voila_port: int) -> None:
+        with self._lock:
+            self.voila_port = voila_port
+
+    def connections(self, voila_port: int) -> int:
+        with self._lock:
+            return self._connections[voila_port]
+
+    def open_connection(self) -> int:
+        with self._lock:
+            self._connections[self.voila_port] += 1
+            return self.voila_port
+
+    def close_connection(self, voila_port: int) -> None:
+        with self._lock:
+            self._connections[voila_port] -= 1
+
+
+class VoilaProcess:
+    def __init__(self, command: List[str], port: int):
+        self.command = command
+        self.port = port
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        log.info("starting %s", " ".join(self.command))
+        self.process = subprocess.Popen(self.command)
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            log.warning("voila did not stop within %ss, killing it", _STOP_TIMEOUT)
+            self.process.kill()
+            self.process.wait()
+
+    def wait(self, timeout: float) -> Optional[int]:
+        """Returns the exit code if voila exited within the timeout"""
+        try:
+            return self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """Whether voila accepts connections within the timeout
+
+        NOTE: the pool might still be filling, the first visitors then wait for
+        the execution as with a cold voila
+        """
+        deadline = time.monotonic() + timeout
+        while self.process.poll() is None and time.monotonic() < deadline:
+            try:
+                socket.create_connection((_VOILA_HOST, self.port), timeout=1).close()
+                return True
+            except OSError:
+                time.sleep(_READY_CHECK_INTERVAL)
+        return False
+
+
+def run(
+    notebook: Path,
+    inputs_folder: Optional[Path],
+    voila_args: List[str],
+    port: int,
+    pool_size: int = POOL_SIZE,
+    poll_interval: float = POLL_INTERVAL,
+    settle_time: float = SETTLE_TIME,
+    drain_timeout: float = DRAIN_TIMEOUT,
+) -> int:
+    preheat = voila_supports_preheat()
+    if not preheat:
+        log.warning("this voila cannot preheat kernels, every visitor waits for the execution")
+
+    def _new_voila() -> VoilaProcess:
+        voila_port = free_port()
+        return VoilaProcess(
+            voila_command(notebook, voila_args, voila_port, pool_size, preheat), voila_port
+        )
+
+    voila = _new_voila()
+    draining: Optional[VoilaProcess] = None
+    drain_deadline = 0.0
+    proxy = VoilaProxy(port, voila.port)
+
+    def _stop() -> None:
+        proxy.server_close()
+        for process in (voila, draining):
+            if process is not None:
+                process.stop()
+
+    def _on_signal(signum, _frame):
+        _stop()
+        sys.exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    debouncer = ChangeDebouncer(fingerprint(notebook, inputs_folder), settle_time)
+    voila.start()
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    while True:
+        exit_code = voila.wait(poll_interval)
+        if exit_code is not None:
+            log.error("voila exited with %s", exit_code)
+            _stop()
+            return exit_code
+        if draining is not None and (
+            proxy.connections(draining.port) == 0 or time.monotonic() > drain_deadline
+        ):
+            draining.stop()
+            draining = None
+        if not preheat:
+            continue
+        if not debouncer.settled(fingerprint(notebook, inputs_folder), time.monotonic()):
+            continue
+
+        log.info("%s or its inputs changed, refreshing the preheated kernels", notebook)
+        replacement = _new_voila()
+        replacement.start()
+        if not replacement.wait_until_ready(_READY_TIMEOUT):
+            log.error("the refreshed voila is not ready, keeping the previous kernels")
+            replacement.stop()
+            continue
+        proxy.switch(replacement.port)
+        if draining is not None:
+            draining.stop()
+        draining, drain_deadline = voila, time.monotonic() + drain_timeout
+        voila = replacement
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("notebook", type=Path)
+    parser.add_argument("--inputs", type=Path, default=None, help="The inputs folder")
+    parser.add_argument("--port", type=int, required=True, help="The port served")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--settle-time", type=float, default=SETTLE_TIME)
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT)
+    args = sys.argv[1:] if args is None else list(args)
+    # everything after -- is passed to voila
+    voila_args = []
+    if "--" in args:
+        separator = args.index("--")
+        args, voila_args = args[:separator], args[separator + 1 :]
+    options = parser.parse_args(args)
+
+    return run(
+        options.notebook,
+        options.inputs,
+        voila_args,
+        options.port,
+        pool_size=options.pool_size,
+        poll_interval=options.poll_interval,
+        settle_time=options.settle_time,
+        drain_timeout=options.drain_timeout,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,9 +1,13 @@
 #!/usr/bin/python
 """
-Used to pull the state of the service. If there is an issue 
+Used to pull the state of the service. If there is an issue
 with the platform it will exit with code 1.
 
-    Usage python state_puller.py PATH_OR_FILE
+    Usage python state_puller.py [--mode {all,priority,remaining}] PATH_OR_FILE
+
+With --mode=priority only the notebooks and the small files are restored, the
+remaining ones are restored afterwards with --mode=remaining. The progress
+is reported in ~/.osparc/restore_progress.json
 """
 import sys
 import argparse
@@ -11,6 +15,7 @@ import asyncio
 import logging
 from pathlib import Path
 
+from jupyter_commons import restore
 from simcore_sdk.node_data import data_manager
 
 logging.basicConfig(level=logging.INFO)
@@ -18,18 +23,28 @@ logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__file__ if __name__ == "__main__" else __name__)
 
 
-async def pull_file_if_exists(path: Path) -> None:
+async def pull_file_if_exists(path: Path, mode: str = "all") -> None:
     """
     If the path already exist in storage pull it. Otherwise it is assumed
     this is the first time the service starts.
 
     In each and every other case an error is raised and logged
     """
+    if mode == "remaining":
+        await restore.restore_remaining(path)
+        log.info("Finished extracting remaining files of %s", str(path))
+        return
+
     if not await data_manager.is_file_present_in_storage(path):
         log.info("File '%s' is not present in storage service, will skip.", str(path))
+        restore.mark_nothing_to_restore()
         return
 
-    await data_manager.pull(path)
+    # base snapshot and the incremental ones pushed on top of it
+    if mode == "priority":
+        await restore.restore_priority(path)
+    else:
+        await restore.restore_state(path)
     log.info("Finished pulling and extracting %s", str(path))
 
 
@@ -38,11 +53,17 @@ def main(args=None) -> int:
     parser.add_argument(
         "path", help="The folder or file to get for the node", type=Path
     )
+    parser.add_argument(
+        "--mode",
+        choices=["all", "priority", "remaining"],
+        default="all",
+        help="What to restore",
+    )
     options = parser.parse_args(args)
 
     try:
         asyncio.get_event_loop().run_until_complete(
-            pull_file_if_exists(path=options.path)
+            pull_file_if_exists(path=options.path, mode=options.mode)
         )
     except Exception:  # pylint: disable=broad-except
         logging.exception("There was an unexpected error. Please check the logs")
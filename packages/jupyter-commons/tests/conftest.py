@@ -0,0 +1,53 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+_HERE = Path(__file__).resolve().parent
+sys.path[:0] = [str(_HERE.parent / "src"), str(_HERE.parent / "benchmarks")]
+
+# jupyter_commons reads its configuration (and HOME) when imported
+_TMP_DIR = Path(tempfile.mkdtemp(prefix="jupyter-commons-tests-"))
+os.environ["HOME"] = str(_TMP_DIR / "home")
+os.environ["SIMCORE_NODE_APP_STATE_PATH"] = str(_TMP_DIR / "state")
+
+import fake_simcore  # isort:skip pylint: disable=wrong-import-position
+
+_STORAGE = fake_simcore.LocalStorage(_TMP_DIR / "storage")
+fake_simcore.install(_STORAGE)
+
+asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def pytest_sessionfinish(session, exitstatus):  # pylint: disable=unused-argument
+    shutil.rmtree(str(_TMP_DIR), ignore_errors=True)
+
+
+@pytest.fixture
+def run():
+    return asyncio.get_event_loop().run_until_complete
+
+
+@pytest.fixture
+def state_path() -> Iterator[Path]:
+    """Empty state folder, storage and local bookkeeping, nothing tracked"""
+    from jupyter_commons import snapshots
+    from jupyter_commons.state_ignore import StateIgnore
+
+    for folder in (_TMP_DIR / "home", _TMP_DIR / "state", _STORAGE.root):
+        shutil.rmtree(str(folder), ignore_errors=True)
+        folder.mkdir(parents=True)
+
+    dirty_paths = snapshots.dirty_paths
+    dirty_paths.tracking = False
+    dirty_paths.skip = lambda rel_path: False
+    dirty_paths.rules_changed = False
+    dirty_paths.state_ignore = StateIgnore.load(dirty_paths.root)
+    dirty_paths.drain()
+    yield dirty_paths.root
+    dirty_paths.tracking = False
@@ -0,0 +1,76 @@
+import asyncio
+
+from jupyter_commons.bandwidth import BACKGROUND, INTERACTIVE, PUSH, BandwidthGovernor
+
+
+def _debts(governor: BandwidthGovernor) -> dict:
+    return {p: c["debt_bytes"] for p, c in governor.stats()["classes"].items()}
+
+
+def _admitted(run, governor: BandwidthGovernor, priority: str, timeout=0.2) -> bool:
+    async def _admit():
+        try:
+            await asyncio.wait_for(governor.admit(priority), timeout)
+        except asyncio.TimeoutError:
+            return False
+        governor.finish(priority)
+        return True
+
+    return run(_admit())
+
+
+def test_unlimited(run):
+    governor = BandwidthGovernor(0, 100)
+    governor.charge(BACKGROUND, 10 ** 9)
+
+    assert _admitted(run, governor, BACKGROUND)
+    assert governor.stats()["max_bytes_per_second"] is None
+    assert set(_debts(governor).values()) == {0}
+
+
+def test_higher_classes_charge_the_lower_buckets(run):
+    governor = BandwidthGovernor(1000, 100)
+    governor.charge(INTERACTIVE, 10 ** 6)
+
+    debts = _debts(governor)
+    assert debts[INTERACTIVE] > 0
+    assert debts[PUSH] > 0 and debts[BACKGROUND] > 0
+    assert not _admitted(run, governor, PUSH)
+
+
+def test_lower_class_debt_does_not_delay_higher_classes(run):
+    governor = BandwidthGovernor(1000, 100)
+    governor.charge(BACKGROUND, 10 ** 6)
+
+    assert _debts(governor)[INTERACTIVE] == _debts(governor)[PUSH] == 0
+    assert _admitted(run, governor, INTERACTIVE)
+    assert _admitted(run, governor, PUSH)
+    assert not _admitted(run, governor, BACKGROUND)
+    assert governor.stats()["classes"][BACKGROUND]["waited_seconds"] > 0
+
+
+def test_debt_paid_back_over_time(run):
+    governor = BandwidthGovernor(10 ** 6, 100)
+    governor.charge(BACKGROUND, 200 * 1000)
+
+    assert _debts(governor)[BACKGROUND] > 0
+    # at 1MB/s, 0.2s are enough
+    assert _admitted(run, governor, BACKGROUND, timeout=1.0)
+    assert _debts(governor)[BACKGROUND] == 0
+
+
+def test_waits_for_higher_classes(run):
+    governor = BandwidthGovernor(0, 100)
+
+    async def _scenario():
+        async with governor.transfer(INTERACTIVE):
+            waiting = asyncio.ensure_future(governor.admit(BACKGROUND))
+            await asyncio.sleep(0.1)
+            assert not waiting.done()
+            assert governor.stats()["classes"][BACKGROUND]["waiting"] == 1
+        await asyncio.wait_for(waiting, 1.0)
+        governor.finish(BACKGROUND)
+
+    run(_scenario())
+    assert governor.stats()["classes"][INTERACTIVE]["transfers"] == 1
+    assert governor.stats()["classes"][BACKGROUND]["transfers"] == 1
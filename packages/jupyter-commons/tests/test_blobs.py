@@ -0,0 +1,142 @@
+import base64
+import copy
+import os
+from pathlib import Path
+
+import nbformat
+from nbformat.sign import NotebookNotary
+from nbformat.v4 import new_code_cell, new_notebook, new_output
+
+from jupyter_commons import blobs, trust
+
+_MIN_SIZE = 1000
+
+_NOTEBOOK = new_notebook(
+    cells=[
+        new_code_cell(
+            "plot()",
+            outputs=[
+                new_output(
+                    "display_data",
+                    data={"image/png": "A" * 5000, "text/plain": "<Figure>"},
+                ),
+                new_output(
+                    "execute_result",
+                    data={"application/json": {"values": list(range(500))}},
+                    execution_count=1,
+                ),
+            ],
+        ),
+        # the same plot again
+        new_code_cell(
+            "plot()",
+            outputs=[new_output("display_data", data={"image/png": "A" * 5000})],
+        ),
+    ]
+)
+
+
+def _notebook():
+    # NOTE: the cell ids are random, i.e. every copy has to be made from the same one
+    return copy.deepcopy(_NOTEBOOK)
+
+
+def _blob_files(blobs_dir: Path):
+    return sorted(path.name for path in blobs_dir.glob("*/*"))
+
+
+def test_round_trip(tmp_path: Path):
+    blobs_dir = tmp_path / blobs.BLOBS_DIR_NAME
+    original = _notebook()
+
+    externalized = blobs.externalize(original, blobs_dir, min_size=_MIN_SIZE)
+
+    assert original == _notebook()
+    outputs = externalized.cells[0].outputs
+    assert outputs[0].data == {"image/png": "", "text/plain": "<Figure>"}
+    assert set(outputs[0].metadata[blobs.METADATA_KEY]) == {"image/png"}
+    assert outputs[1].data == {"application/json": {}}
+    # identical outputs share the same blob
+    assert len(_blob_files(blobs_dir)) == 2
+
+    on_disk = nbformat.reads(nbformat.writes(externalized), as_version=4)
+    assert blobs.rehydrate(on_disk, blobs_dir) == original
+
+
+def test_small_outputs_stay_in_the_notebook(tmp_path: Path):
+    blobs_dir = tmp_path / blobs.BLOBS_DIR_NAME
+
+    assert blobs.externalize(_notebook(), blobs_dir, min_size=10 ** 6) == _notebook()
+    assert blobs.externalize(_notebook(), blobs_dir, min_size=0) == _notebook()
+    assert not blobs_dir.exists()
+
+
+def test_signed_as_served(tmp_path: Path):
+    blobs_dir = tmp_path / blobs.BLOBS_DIR_NAME
+    nbformat.write(
+        blobs.externalize(_notebook(), blobs_dir, min_size=_MIN_SIZE),
+        str(tmp_path / "nb.ipynb"),
+    )
+
+    assert trust.trust_notebooks(tmp_path) == 1
+    notary = NotebookNotary(data_dir=str(trust.trust_data_dir(tmp_path)))
+    # i.e. trusted once rehydrated by the contents manager
+    assert notary.check_signature(_notebook())
+
+    # unchanged: nothing to sign
+    assert trust.trust_notebooks(tmp_path) == 0
+
+
+def test_garbage_collection_keeps_the_checkpoints_outputs(tmp_path: Path):
+    state_path, checkpoints = tmp_path / "state", tmp_path / "checkpoints"
+    blobs_dir = state_path / blobs.BLOBS_DIR_NAME
+    checkpoints.mkdir()
+    nbformat.write(
+        blobs.externalize(_notebook(), blobs_dir, min_size=_MIN_SIZE),
+        str(checkpoints / "nb-checkpoint.ipynb"),
+    )
+    state_path.joinpath("nb.ipynb").write_text(nbformat.writes(new_notebook()))
+    unused = blobs._write_blob(  # pylint: disable=protected-access
+        blobs_dir, b"no longer referenced"
+    )
+    for path in blobs_dir.glob("*/*"):
+        os.utime(str(path), (0, 0))
+
+    assert blobs.collect_garbage(state_path, checkpoints) == 1
+    assert unused not in _blob_files(blobs_dir)
+    assert len(_blob_files(blobs_dir)) == 2
+
+    assert blobs.collect_garbage(state_path) == 2
+    assert not _blob_files(blobs_dir)
+
+
+def test_served_with_outputs_as_file(tmp_path: Path):
+    from jupyter_commons.contents import StateContentsManager, StateFilesHandler
+
+    notebook = new_notebook(
+        cells=[
+            new_code_cell(
+                "plot()",
+                outputs=[
+                    new_output(
+                        "display_data", data={"image/png": "A" * (blobs.MIN_OUTPUT_SIZE + 1)}
+                    )
+                ],
+            )
+        ]
+    )
+    cm = StateContentsManager(root_dir=str(tmp_path))
+    cm.save({"type": "notebook", "content": copy.deepcopy(notebook)}, "nb.ipynb")
+    on_disk = (tmp_path / "nb.ipynb").read_text()
+    assert blobs.METADATA_KEY in on_disk
+    assert len(on_disk) < blobs.MIN_OUTPUT_SIZE
+
+    served = cm.get("nb.ipynb")["content"]
+    assert served.cells[0].outputs == notebook.cells[0].outputs
+    for model_format in ("text", "base64", None):
+        model = cm.get("nb.ipynb", type="file", format=model_format)
+        content = model["content"]
+        if model["format"] == "base64":
+            content = base64.decodebytes(content.encode("ascii")).decode("utf-8")
+        assert nbformat.reads(content, as_version=4) == notebook
+    assert cm.files_handler_class is StateFilesHandler
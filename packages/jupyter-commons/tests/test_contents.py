@@ -0,0 +1,85 @@
+import logging
+import time
+import types
+from pathlib import Path
+
+import pytest
+from tornado import web
+
+from jupyter_commons import readiness, restore
+from jupyter_commons.contents import StateContentsManager
+
+_TEXT = {"type": "file", "format": "text", "content": "user's"}
+
+
+@pytest.fixture
+def cm(state_path: Path) -> StateContentsManager:
+    """data/large.bin is still being restored"""
+    (state_path / "data").mkdir()
+    (state_path / "data" / "small.txt").write_text("restored")
+    (state_path / "other").mkdir()
+    readiness.reset()
+    restore.RestoreProgress(
+        state=restore.RESTORING_REMAINING, started_at=time.time(), pending=["data/large.bin"]
+    ).save()
+    readiness.set_ready()
+    return StateContentsManager(root_dir=str(state_path))
+
+
+def _status_code(func, *args) -> int:
+    with pytest.raises(web.HTTPError) as exc_info:
+        func(*args)
+    return exc_info.value.status_code
+
+
+def test_pending_paths_cannot_be_changed(cm: StateContentsManager, state_path: Path):
+    assert _status_code(cm.save, _TEXT, "data/large.bin") == 503
+    assert _status_code(cm.delete, "data/large.bin") == 503
+    assert _status_code(cm.rename, "other/new.txt", "data/large.bin") == 503
+    assert not (state_path / "data" / "large.bin").exists()
+
+
+def test_folders_with_pending_paths_cannot_be_moved(cm: StateContentsManager, state_path: Path):
+    assert _status_code(cm.delete, "data") == 503
+    assert _status_code(cm.rename, "data", "moved") == 503
+    assert (state_path / "data" / "small.txt").exists()
+
+
+def test_restored_paths_can_be_changed(cm: StateContentsManager, state_path: Path):
+    cm.save(_TEXT, "data/small.txt")
+    cm.rename("data/small.txt", "other/small.txt")
+    cm.delete("other/small.txt")
+    assert not list(state_path.rglob("*.txt"))
+
+    restore.RestoreProgress(state=restore.COMPLETED, started_at=time.time()).save()
+    cm.save(_TEXT, "data/large.bin")
+    cm.delete("data")
+
+
+def test_pending_paths_answer_503(cm: StateContentsManager):
+    assert _status_code(cm.get, "data/large.bin") == 503
+    assert cm.get("data/small.txt")["content"] == "restored"
+
+    readiness.reset()
+    assert _status_code(cm.get, "") == 503
+
+
+def test_waiting_handlers_registered(cm: StateContentsManager):
+    from notebook.services.contents.handlers import CheckpointsHandler
+    from tornado.httputil import HTTPServerRequest
+
+    from jupyter_commons import contents
+
+    web_app = web.Application(base_url="/base/", contents_manager=cm)
+    contents.load_jupyter_server_extension(
+        types.SimpleNamespace(web_app=web_app, log=logging.getLogger(__name__))
+    )
+
+    def _handler_class(uri: str):
+        request = HTTPServerRequest(method="GET", uri=uri, host="localhost")
+        return web_app.find_handler(request).handler_class
+
+    assert _handler_class("/base/api/contents/data") is contents.WaitingContentsHandler
+    assert _handler_class("/base/api/contents/nb.ipynb/checkpoints") is CheckpointsHandler
+    assert _handler_class("/base/notebooks/nb.ipynb") is contents.WaitingNotebookHandler
+    assert cm.files_handler_class is contents.StateFilesHandler
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import threading
+import time
+
+from jupyter_commons import event_loop
+from jupyter_commons.event_loop import LagMonitor
+
+
+def test_run_blocking_off_the_loop(run):
+    loop_thread = threading.get_ident()
+
+    def _blocking(value, suffix=""):
+        return threading.get_ident(), value + suffix
+
+    thread, result = run(event_loop.run_blocking(_blocking, "a", suffix="b"))
+    assert result == "ab"
+    assert thread != loop_thread
+
+
+def test_background_failures_are_logged(caplog):
+    def _fails():
+        raise OSError("gone")
+
+    with caplog.at_level(logging.ERROR, logger=event_loop.__name__):
+        future = event_loop.run_blocking_in_background(_fails)
+        assert isinstance(future.exception(timeout=1), OSError)
+        # the callback runs right after the result is set
+        time.sleep(0.1)
+
+    assert "background call failed" in caplog.text
+
+
+def test_lag_monitor_reports_the_blocking_call(run, caplog):
+    monitor = LagMonitor(threshold=0.1)
+
+    def _blocks_the_loop():
+        time.sleep(0.5)
+
+    async def _scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        _blocks_the_loop()
+        await asyncio.sleep(0.1)
+
+    with caplog.at_level(logging.WARNING, logger=event_loop.__name__):
+        run(_scenario())
+
+    # once per blocking episode
+    assert monitor.blocked_count == 1
+    assert monitor.stats()["max_lag"] >= 0.3
+    assert "_blocks_the_loop" in caplog.text
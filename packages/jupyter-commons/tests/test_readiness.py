@@ -0,0 +1,101 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from jupyter_commons import readiness, restore
+
+
+def _run_phase(phase: str, exit_code: int) -> int:
+    return readiness.run_phase(phase, [sys.executable, "-c", f"raise SystemExit({exit_code})"])
+
+
+def _set_progress(state: str, pending=()) -> None:
+    restore.RestoreProgress(state=state, started_at=time.time(), pending=list(pending)).save()
+
+
+def test_no_gate_is_ready(state_path: Path):
+    # e.g. the server is not started by docker/boot_notebook.bash
+    assert readiness.current_status() is None
+    assert readiness.is_ready() and not readiness.has_failed()
+    assert restore.push_status() == restore.PUSH_ALLOWED
+
+
+def test_boot_phases(run, state_path: Path):
+    readiness.reset()
+    assert not readiness.is_ready()
+    assert restore.push_status() == restore.PUSH_LATER
+
+    assert _run_phase("restore", 0) == 0
+    assert not readiness.is_ready()
+    readiness.set_ready()
+    run(readiness.wait_until_ready(poll_interval=0.01))
+
+    status = readiness.current_status()
+    assert status["ready"] and status["failed"] is None
+    assert set(status["phases"]) == {"restore"}
+    assert readiness.main(["wait"]) == 0
+
+
+def test_failed_boot_phase(run, state_path: Path):
+    readiness.reset()
+
+    assert _run_phase("restore", 3) == 3
+
+    assert readiness.has_failed() and not readiness.is_ready()
+    # does not wait forever
+    run(readiness.wait_until_ready(poll_interval=0.01))
+    assert readiness.main(["wait"]) == 1
+    # the folder is incomplete, it must not replace the stored state
+    assert restore.push_status() == restore.PUSH_REFUSED
+
+
+def test_push_status_while_restoring(state_path: Path):
+    readiness.reset()
+    _set_progress(restore.RESTORING)
+    assert restore.push_status() == restore.PUSH_LATER
+
+    _set_progress(restore.RESTORING_REMAINING, pending=["large.bin"])
+    assert restore.push_status() == restore.PUSH_LATER
+    readiness.set_ready()
+    assert restore.push_status() == restore.PUSH_DELTA_ONLY
+    assert restore.is_pending("large.bin")
+
+    _set_progress(restore.COMPLETED)
+    assert restore.push_status() == restore.PUSH_ALLOWED
+    assert not restore.is_pending("large.bin")
+
+
+def test_remaining_restore_failure_keeps_the_changes_pushable(state_path: Path):
+    readiness.reset()
+    _set_progress(restore.RESTORING_REMAINING, pending=["large.bin"])
+    readiness.set_ready()
+
+    _set_progress(restore.FAILED, pending=["large.bin"])
+
+    # the changes are tracked since readiness, only a new base is refused
+    assert restore.push_status() == restore.PUSH_DELTA_ONLY
+    assert not restore.is_pending("large.bin")
+
+
+def test_contents_during_and_after_a_failed_boot(state_path: Path):
+    from tornado import web
+
+    from jupyter_commons.contents import StateContentsManager
+
+    (state_path / "restored.txt").write_text("restored")
+    cm = StateContentsManager(root_dir=str(state_path))
+    model = {"type": "file", "format": "text", "content": "new"}
+
+    readiness.reset()
+    with pytest.raises(web.HTTPError) as exc_info:
+        cm.save(model, "new.txt")
+    assert exc_info.value.status_code == 503
+
+    _run_phase("restore", 1)
+    with pytest.raises(web.HTTPError) as exc_info:
+        cm.save(model, "new.txt")
+    assert exc_info.value.status_code == 409
+    assert "could not be restored" in exc_info.value.log_message
+    assert cm.get("restored.txt")["content"] == "restored"
@@ -0,0 +1,131 @@
+import shutil
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from jupyter_commons import bandwidth, restore, snapshots
+
+
+def _write(state_path: Path, files: Dict[str, str]) -> None:
+    for rel_path, content in files.items():
+        path = state_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def _read_all(state_path: Path) -> Dict[str, str]:
+    return {
+        path.relative_to(state_path).as_posix(): path.read_text()
+        for path in state_path.rglob("*")
+        if path.is_file()
+    }
+
+
+def _wipe(state_path: Path) -> None:
+    shutil.rmtree(str(state_path))
+    state_path.mkdir()
+
+
+def test_round_trip_with_deletions(run, state_path: Path):
+    _write(
+        state_path,
+        {
+            "a.txt": "a",
+            "sub/b.txt": "b",
+            "sub/deeper/c.txt": "c",
+            "kept/d.txt": "d",
+            "scratch.tmp": "ignored by default",
+        },
+    )
+    run(snapshots.save_state(state_path))
+    snapshots.start_tracking()
+
+    (state_path / "a.txt").write_text("a, modified")
+    snapshots.dirty_paths.mark_changed(str(state_path / "a.txt"))
+    _write(state_path, {"kept/e.txt": "e"})
+    snapshots.dirty_paths.mark_changed(str(state_path / "kept" / "e.txt"))
+    shutil.rmtree(str(state_path / "sub"))
+    snapshots.dirty_paths.mark_deleted(str(state_path / "sub"))
+    run(snapshots.save_state(state_path))
+
+    chain = snapshots.SnapshotChain.load()
+    assert chain.deltas == 1
+    assert chain.files == {"a.txt", "kept/d.txt", "kept/e.txt"}
+
+    _wipe(state_path)
+    run(restore.restore_state(state_path))
+
+    assert _read_all(state_path) == {
+        "a.txt": "a, modified",
+        "kept/d.txt": "d",
+        "kept/e.txt": "e",
+    }
+    assert restore.RestoreProgress.load().state == restore.COMPLETED
+
+
+def test_large_files_restored_last(run, state_path: Path):
+    _write(state_path, {"nb.ipynb": "{}", "small.txt": "s", "large.bin": "x" * 1000})
+    run(snapshots.save_state(state_path))
+    _wipe(state_path)
+
+    progress = run(restore.restore_priority(state_path, priority_max_file_size=100))
+    assert progress.state == restore.RESTORING_REMAINING
+    assert progress.pending == ["large.bin"]
+    assert sorted(_read_all(state_path)) == ["nb.ipynb", "small.txt"]
+    assert restore.is_being_restored("large.bin")
+    assert restore.is_being_restored(".large.bin.restoring")
+    assert not restore.is_being_restored("small.txt")
+
+    progress = run(restore.restore_remaining(state_path))
+    assert progress.state == restore.COMPLETED
+    assert (state_path / "large.bin").read_text() == "x" * 1000
+    assert not restore.is_being_restored("large.bin")
+
+
+def test_new_base_supersedes_the_deltas(run, state_path: Path):
+    _write(state_path, {"a.txt": "1"})
+    run(snapshots.save_state(state_path))
+    snapshots.start_tracking()
+    (state_path / "a.txt").write_text("2")
+    snapshots.dirty_paths.mark_changed(str(state_path / "a.txt"))
+    run(snapshots.save_state(state_path))
+    old_generation = snapshots.SnapshotChain.load().generation
+
+    (state_path / "a.txt").write_text("3")
+    run(snapshots.save_state(state_path, full=True))
+
+    chain = snapshots.SnapshotChain.load()
+    assert chain.generation != old_generation
+    assert chain.deltas == 0
+    assert chain.stale_deltas == [snapshots.delta_name(state_path, old_generation, 1)]
+
+    # the delta of the older chain is not applied on top of the new base
+    _wipe(state_path)
+    run(restore.restore_state(state_path))
+    assert _read_all(state_path) == {"a.txt": "3"}
+    assert snapshots.SnapshotChain.load().stale_deltas == chain.stale_deltas
+
+
+def test_delta_only_refuses_a_base(run, state_path: Path):
+    _write(state_path, {"a.txt": "1"})
+
+    with pytest.raises(snapshots.BaseSnapshotRequired):
+        run(snapshots.save_state(state_path, delta_only=True))
+    assert snapshots.SnapshotChain.load().generation is None
+
+
+def test_pushed_in_the_requested_class(run, state_path: Path):
+    def _transfers():
+        classes = bandwidth.governor.stats()["classes"]
+        return {p: classes[p]["transfers"] for p in (bandwidth.PUSH, bandwidth.BACKGROUND)}
+
+    _write(state_path, {"a.txt": "1"})
+    before = _transfers()
+    # e.g. POST /state, the platform is waiting for it
+    run(snapshots.save_state(state_path))
+    run(snapshots.save_state(state_path, full=True, priority=bandwidth.BACKGROUND))
+
+    after = _transfers()
+    assert after[bandwidth.PUSH] == before[bandwidth.PUSH] + 1
+    assert after[bandwidth.BACKGROUND] == before[bandwidth.BACKGROUND] + 1
@@ -0,0 +1,70 @@
+from pathlib import Path
+
+import pytest
+
+from jupyter_commons import state_ignore
+from jupyter_commons.state_ignore import STATE_IGNORE_FILE_NAME, StateIgnore, plan
+
+
+@pytest.mark.parametrize(
+    "rel_path,ignored",
+    [
+        ("inputs/input_1/data.csv", True),
+        ("work/inputs/data.csv", False),
+        ("work/.ipynb_checkpoints/nb-checkpoint.ipynb", True),
+        ("work/module.pyc", True),
+        ("work/nb.ipynb", False),
+    ],
+)
+def test_default_rules(rel_path: str, ignored: bool):
+    assert not StateIgnore([]).is_ignored(rel_path)
+    assert StateIgnore(state_ignore.DEFAULT_RULES).is_ignored(rel_path) == ignored
+
+
+def test_last_matching_rule_wins():
+    assert not StateIgnore(["*.log", "!keep.log"]).is_ignored("logs/keep.log")
+    assert StateIgnore(["*.log", "!keep.log"]).is_ignored("logs/other.log")
+    assert StateIgnore(["!keep.log", "*.log"]).is_ignored("logs/keep.log")
+
+
+def test_excluded_folder_cannot_be_re_included_from():
+    rules = StateIgnore(["build/", "!build/keep.txt"])
+    assert rules.is_ignored("build/keep.txt")
+    assert rules.is_ignored("build/other.txt")
+
+
+def test_anchored_and_folder_only_rules():
+    rules = StateIgnore(["/data.csv", "cache/", "# comment", ""])
+    assert rules.is_ignored("data.csv")
+    assert not rules.is_ignored("sub/data.csv")
+    assert rules.is_ignored("sub/cache/file.bin")
+    # a file named like the folder pattern
+    assert not rules.is_ignored("sub/cache")
+
+
+def test_rules_file_on_top_of_the_defaults(tmp_path: Path):
+    (tmp_path / STATE_IGNORE_FILE_NAME).write_text("*.bin\n!/outputs/\n")
+    (tmp_path / "outputs").mkdir()
+    (tmp_path / "outputs" / "result.txt").write_text("1234")
+    (tmp_path / "large.bin").write_text("12345678")
+    (tmp_path / "nb.ipynb").write_text("{}")
+
+    stored, skipped = plan(tmp_path, StateIgnore.load(tmp_path))
+
+    assert stored == {
+        STATE_IGNORE_FILE_NAME: {"files": 1, "bytes": 17},
+        "nb.ipynb": {"files": 1, "bytes": 2},
+        "outputs": {"files": 1, "bytes": 4},
+    }
+    assert skipped == {"large.bin": {"files": 1, "bytes": 8}}
+
+
+def test_too_large_files_are_skipped(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(state_ignore, "MAX_FILE_SIZE", 4)
+    (tmp_path / "small.txt").write_text("1234")
+    (tmp_path / "large.txt").write_text("12345")
+
+    stored, skipped = plan(tmp_path, StateIgnore.load(tmp_path))
+
+    assert set(stored) == {"small.txt"}
+    assert set(skipped) == {"large.txt"}
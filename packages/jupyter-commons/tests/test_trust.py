@@ -0,0 +1,71 @@
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import nbformat
+from nbformat.sign import NotebookNotary
+from nbformat.v4 import new_code_cell, new_notebook
+
+from jupyter_commons import restore, snapshots, trust
+
+
+def _write_notebooks(state_path: Path, count: int) -> None:
+    for i in range(count):
+        folder = state_path / f"work{i % 2}"
+        folder.mkdir(exist_ok=True)
+        nbformat.write(
+            new_notebook(cells=[new_code_cell(f"print({i})")]), str(folder / f"nb{i}.ipynb")
+        )
+
+
+def _notary(state_path: Path) -> NotebookNotary:
+    return NotebookNotary(data_dir=str(trust.trust_data_dir(state_path)))
+
+
+def test_only_new_or_modified_notebooks_are_signed(tmp_path: Path):
+    _write_notebooks(tmp_path, 6)
+    assert trust.trust_notebooks(tmp_path) == 6
+    assert trust.trust_notebooks(tmp_path) == 0
+
+    notebook_path = tmp_path / "work0" / "nb0.ipynb"
+    notebook = nbformat.read(str(notebook_path), as_version=4)
+    # same size, different content
+    notebook.cells[0].source = "print(9)"
+    nbformat.write(notebook, str(notebook_path))
+
+    assert trust.trust_notebooks(tmp_path) == 1
+    assert _notary(tmp_path).check_signature(notebook)
+
+
+def test_signed_again_once_the_database_is_lost(tmp_path: Path):
+    _write_notebooks(tmp_path, 1)
+    assert trust.trust_notebooks(tmp_path) == 1
+
+    (trust.trust_data_dir(tmp_path) / "nbsignatures.db").unlink()
+
+    assert trust.trust_notebooks(tmp_path) == 1
+    notebook = nbformat.read(str(tmp_path / "work0" / "nb0.ipynb"), as_version=4)
+    assert _notary(tmp_path).check_signature(notebook)
+
+
+def test_restored_notebooks_are_not_signed_again(run, state_path: Path, caplog):
+    _write_notebooks(state_path, 6)
+    assert trust.trust_notebooks(state_path) == 6
+    run(snapshots.save_state(state_path))
+    shutil.rmtree(str(state_path))
+    state_path.mkdir()
+    run(restore.restore_state(state_path))
+
+    with caplog.at_level(logging.INFO, logger=trust.__name__):
+        assert trust.trust_notebooks(state_path) == 0
+    assert "6 notebooks: 0 checked" in caplog.text
+
+    # the modification times of the restore are now known
+    index = json.loads((trust.trust_data_dir(state_path) / "trust_index.json").read_text())
+    assert {
+        rel_path: entry["mtime_ns"] for rel_path, entry in index.items()
+    } == {
+        path.relative_to(state_path).as_posix(): path.stat().st_mtime_ns
+        for path in state_path.rglob("*.ipynb")
+    }
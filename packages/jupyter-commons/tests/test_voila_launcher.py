@@ -0,0 +1,112 @@
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+
+import pytest
+
+from jupyter_commons import voila_launcher
+from jupyter_commons.voila_launcher import ChangeDebouncer, VoilaProxy
+
+
+def test_fingerprint(tmp_path: Path):
+    notebook, inputs = tmp_path / "voila.ipynb", tmp_path / "inputs"
+    inputs.mkdir()
+    (inputs / "data.csv").write_text("1,2")
+    missing = voila_launcher.fingerprint(notebook, inputs)
+
+    notebook.write_text("{}")
+    with_notebook = voila_launcher.fingerprint(notebook, inputs)
+    assert with_notebook != missing
+    assert voila_launcher.fingerprint(notebook, inputs) == with_notebook
+
+    os.utime(str(inputs / "data.csv"), (0, 0))
+    assert voila_launcher.fingerprint(notebook, inputs) != with_notebook
+    assert voila_launcher.fingerprint(notebook, None) != with_notebook
+
+
+@pytest.mark.parametrize(
+    "version,expected",
+    [("0.3.0", (0, 3)), ("0.2.10", (0, 2)), ("1.0.0rc1", (1, 0)), ("0.3.0a2", (0, 3))],
+)
+def test_parse_version(version: str, expected: tuple):
+    # pylint: disable=protected-access
+    assert voila_launcher._parse_version(version) == expected
+
+
+def test_voila_command():
+    command = voila_launcher.voila_command(
+        Path("voila.ipynb"), ["--port", "8888"], 9000, pool_size=2, preheat=True
+    )
+    # the port of the proxy is overridden
+    assert command.index("--Voila.port=9000") > command.index("8888")
+    assert "--VoilaConfiguration.default_pool_size=2" in command
+
+    cold = voila_launcher.voila_command(Path("voila.ipynb"), [], 9000, 2, preheat=False)
+    assert not any("VoilaConfiguration" in arg for arg in cold)
+
+
+def test_changes_settle_before_a_refresh():
+    debouncer = ChangeDebouncer("a", settle_time=10)
+
+    assert not debouncer.settled("a", now=100)
+    # e.g. inputs still being retrieved
+    assert not debouncer.settled("b", now=100)
+    assert not debouncer.settled("c", now=105)
+    assert not debouncer.settled("c", now=114)
+    assert debouncer.settled("c", now=115)
+    assert not debouncer.settled("c", now=130)
+    # back to a previous version
+    assert not debouncer.settled("a", now=130)
+    assert debouncer.settled("a", now=140)
+
+
+class _Greeter(socketserver.ThreadingTCPServer):
+    """Answers its name, then echoes"""
+
+    daemon_threads = True
+
+    def __init__(self, name: bytes):
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.sendall(name)
+                while True:
+                    data = self.request.recv(1024)
+                    if not data:
+                        return
+                    self.request.sendall(data)
+
+        super().__init__(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+def _connect(proxy: VoilaProxy) -> socket.socket:
+    return socket.create_connection(("127.0.0.1", proxy.server_address[1]), timeout=5)
+
+
+def test_proxy_switches_over_new_connections():
+    blue, green = _Greeter(b"blue"), _Greeter(b"green")
+    proxy = VoilaProxy(0, blue.port)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    try:
+        with _connect(proxy) as session:
+            assert session.recv(1024) == b"blue"
+            proxy.switch(green.port)
+
+            with _connect(proxy) as new_session:
+                assert new_session.recv(1024) == b"green"
+            # the session already open stays on the previous voila
+            session.sendall(b"ping")
+            assert session.recv(1024) == b"ping"
+            assert proxy.connections(blue.port) == 1
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+        for server in (blue, green):
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,240 @@
+'''
+    Batch mode of the dockerizer: builds (and publishes) every service under a tree
+
+    - a service is a folder with a Dockerfile and a labels folder, the image is
+      named after the folder
+    - the build context (as sent to docker, i.e. without the .dockerignore'd
+      files) and the labels are hashed and stored as a label of the image: an
+      image is only rebuilt if its hash changed and only pushed if the registry
+      does not have it yet
+    - images are built concurrently and pushed as soon as they are built, with
+      a progress report
+'''
+import collections
+import hashlib
+import json
+import os
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import docker
+from docker.utils.build import exclude_paths
+
+HASH_LABEL = 'io.simcore.build-hash'
+
+LOCAL_REGISTRY_NAME = 'dockerize-registry'
+LOCAL_REGISTRY_IMAGE = 'registry:2'
+
+_SKIPPED_FOLDERS = {'node_modules', '__pycache__'}
+_PROGRESS_INTERVAL = 2.0
+
+Service = collections.namedtuple(
+    'Service', ['path', 'tag', 'labels', 'dockerfile', 'context_hash'])
+
+_print_lock = threading.Lock()
+
+
+def _print(*args):
+    # builds and pushes report from several threads
+    with _print_lock:
+        print(*args)
+        sys.stdout.flush()
+
+
+def read_labels(model_root_path):
+    labels = {}
+    label_path = os.path.join(model_root_path, "labels")
+    for file in sorted(os.listdir(label_path)):
+        if file.endswith(".json"):
+            json_file = os.path.join(label_path, file)
+            label_name = os.path.splitext(file)[0]
+            with open(json_file) as json_data:
+                label_dict = json.load(json_data)
+                # TODO: Validate label dict syntax
+                labels["io.simcore."+label_name] = json.dumps(label_dict)
+    return labels
+
+
+def make_tag(registry, namespace, imagename, version):
+    tag = ''
+    if registry:
+        tag = registry + "/"
+    return tag + namespace + "/" + imagename + ":" + version
+
+
+def discover_services(root, dockerfile='Dockerfile'):
+    for folder, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in _SKIPPED_FOLDERS and not d.startswith('.'))
+        if dockerfile in filenames and os.path.isdir(os.path.join(folder, 'labels')):
+            # the sub-folders are part of its build context
+            dirnames[:] = []
+            yield folder
+
+
+def _read_dockerignore(path):
+    # same as docker.api.build
+    dockerignore = os.path.join(path, '.dockerignore')
+    if not os.path.exists(dockerignore):
+        return None
+    with open(dockerignore, 'r') as f:
+        return [l.strip() for l in f.read().splitlines() if l.strip() and l.strip()[0] != '#']
+
+
+def hash_context(path, dockerfile, labels):
+    digest = hashlib.sha256()
+    patterns = _read_dockerignore(path) or []
+    for rel_path in sorted(exclude_paths(path, patterns, dockerfile=dockerfile)):
+        full_path = os.path.join(path, rel_path)
+        file_stat = os.lstat(full_path)
+        digest.update('{}\0{:o}\0'.format(rel_path, file_stat.st_mode).encode())
+        if stat.S_ISLNK(file_stat.st_mode):
+            digest.update(os.readlink(full_path).encode())
+        elif stat.S_ISREG(file_stat.st_mode):
+            with open(full_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    digest.update(dockerfile.encode())
+    digest.update(json.dumps(labels, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_service(path, registry, namespace, version, dockerfile='Dockerfile'):
+    labels = read_labels(path)
+    imagename = os.path.basename(os.path.abspath(path)).lower()
+    return Service(
+        path=path,
+        tag=make_tag(registry, namespace, imagename, version),
+        labels=labels,
+        dockerfile=dockerfile,
+        context_hash=hash_context(path, dockerfile, labels))
+
+
+def _client():
+    # NOTE: one client per thread, they are not meant to be shared
+    return docker.from_env(version='auto')
+
+
+def _built_hash(client, tag):
+    try:
+        return client.images.get(tag).labels.get(HASH_LABEL)
+    except docker.errors.ImageNotFound:
+        return None
+
+
+def build_service(service, force=False):
+    ''' returns True if the image was built, False if it was up to date '''
+    client = _client()
+    if not force and _built_hash(client, service.tag) == service.context_hash:
+        _print(service.tag, 'is up to date')
+        return False
+    _print(service.tag, 'building from', service.path)
+    start_time = time.time()
+    labels = dict(service.labels)
+    labels[HASH_LABEL] = service.context_hash
+    client.images.build(
+        path=service.path, tag=service.tag, labels=labels, dockerfile=service.dockerfile)
+    _print(service.tag, 'built in {:.1f}s'.format(time.time() - start_time))
+    return True
+
+
+def is_published(client, tag):
+    repository = tag.rsplit(':', 1)[0]
+    try:
+        image = client.images.get(tag)
+        digest = client.images.get_registry_data(tag).id
+    except docker.errors.APIError:
+        return False
+    return '{}@{}'.format(repository, digest) in image.attrs.get('RepoDigests', [])
+
+
+def _report_push(tag, layers, done=False):
+    current = sum(c for c, _ in layers.values())
+    total = sum(t for _, t in layers.values())
+    percent = 100 if done else int(100 * current / total) if total else 0
+    _print('{}: pushed {}% of {} layers'.format(tag, percent, len(layers)))
+
+
+def push_service(service, force=False):
+    ''' returns True if the image was pushed, False if the registry had it '''
+    client = _client()
+    if not force and is_published(client, service.tag):
+        _print(service.tag, 'is already published')
+        return False
+    layers = {}
+    last_report = time.time()
+    for event in client.api.push(service.tag, stream=True, decode=True):
+        if 'error' in event:
+            raise docker.errors.APIError(event['error'])
+        layer = event.get('id')
+        detail = event.get('progressDetail') or {}
+        if layer and detail.get('total'):
+            layers[layer] = (detail.get('current', 0), detail['total'])
+        elif layer and event.get('status') in ('Pushed', 'Layer already exists'):
+            total = layers.get(layer, (1, 1))[1]
+            layers[layer] = (total, total)
+        if time.time() - last_report > _PROGRESS_INTERVAL:
+            last_report = time.time()
+            _report_push(service.tag, layers)
+    _report_push(service.tag, layers, done=True)
+    return True
+
+
+def start_local_registry(port=5000):
+    ''' starts (if needed) a registry container for testing, returns its address '''
+    client = _client()
+    try:
+        container = client.containers.get(LOCAL_REGISTRY_NAME)
+        if container.status != 'running':
+            container.start()
+    except docker.errors.NotFound:
+        client.containers.run(
+            LOCAL_REGISTRY_IMAGE, name=LOCAL_REGISTRY_NAME, detach=True,
+            ports={'5000/tcp': port})
+    return 'localhost:{}'.format(port)
+
+
+def run_batch(root, registry, namespace, version, dockerfile='Dockerfile',
+              publish=False, jobs=4, force=False):
+    ''' builds (and pushes) all the services under root, returns the paths of the failed ones '''
+    paths = list(discover_services(root, dockerfile))
+    _print('found {} services under {}'.format(len(paths), root))
+
+    services, failed = [], []
+    for path in paths:
+        try:
+            services.append(load_service(path, registry, namespace, version, dockerfile))
+        except (OSError, ValueError) as err:
+            # e.g. invalid labels: the others are still built
+            _print(path, 'FAILED to load:', err)
+            failed.append(path)
+
+    with ThreadPoolExecutor(max_workers=jobs) as build_pool, \
+            ThreadPoolExecutor(max_workers=jobs) as push_pool:
+        builds = {build_pool.submit(build_service, s, force): s for s in services}
+        pushes = {}
+        for future in as_completed(builds):
+            service = builds[future]
+            try:
+                future.result()
+            except (docker.errors.DockerException, OSError) as err:
+                _print(service.tag, 'FAILED to build:', err)
+                failed.append(service.path)
+                continue
+            if publish:
+                # pushed while the others are still being built
+                pushes[push_pool.submit(push_service, service, force)] = service
+
+        for future in as_completed(pushes):
+            service = pushes[future]
+            try:
+                future.result()
+            except (docker.errors.DockerException, OSError) as err:
+                _print(service.tag, 'FAILED to push:', err)
+                failed.append(service.path)
+
+    _print('{} services, {} failed'.format(len(paths), len(failed)))
+    return failed
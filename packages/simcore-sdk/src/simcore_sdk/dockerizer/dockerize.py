@@ -1,7 +1,8 @@
 import sys, os
 from optparse import OptionParser
 import docker
-import json
+
+from simcore_sdk.dockerizer.batch import make_tag, read_labels, run_batch, start_local_registry
 
 def main(argv):
     '''
@@ -45,6 +46,18 @@ def main(argv):
 
         The script looks up all json files in the labels directory and labels the image accordingly
 
+        Batch mode:
+
+        --batch:            build every service (folder with a Dockerfile and a labels folder)
+                            found under this directory, the images are named after the folders
+        --jobs:             how many images are built (and pushed) at the same time, defaults to 4
+        --force:            build (and push) even if neither the context nor the labels changed
+        --local-registry:   start (if needed) a registry container on localhost:5000 and use it
+
+        3.  dockerize --batch=services --namespace=simcore/services/comp --version=1.0 --local-registry --publish
+
+        builds the changed images under services/ and pushes them to localhost:5000
+
 
     '''
     parser = OptionParser()
@@ -63,11 +76,23 @@ def main(argv):
     parser.add_option(
         "-p", "--publish", action="store_true", dest="publish", help="publish in registry")
 
+    parser.add_option(
+        "-b", "--batch", dest="batch", help="build all the services under this directory")
+    parser.add_option(
+        "-j", "--jobs", dest="jobs", type="int", default=4, help="concurrent builds in batch mode")
+    parser.add_option(
+        "-f", "--force", action="store_true", dest="force", help="build even if unchanged")
+    parser.add_option(
+        "--local-registry", action="store_true", dest="local_registry",
+        help="use a local registry container, for testing")
 
     (options, _args) = parser.parse_args(sys.argv)
 
+    if options.local_registry:
+        options.registry = start_local_registry()
+
     # we should have a name, a version and a namespace
-    if not options.imagename:
+    if not options.imagename and not options.batch:
         parser.error('Image name not given')
     if not options.version:
         parser.error('Version not given')
@@ -83,26 +108,16 @@ def main(argv):
         dockerfile = options.dockerfile
 
 
+    if options.batch:
+        failed = run_batch(
+            options.batch, options.registry, options.namespace, options.version,
+            dockerfile=dockerfile, publish=options.publish, jobs=options.jobs,
+            force=options.force)
+        sys.exit(1 if failed else 0)
+
     model_root_path = os.getcwd()
-    label_path = os.path.join(model_root_path, "labels")
-    
-    labels = {}
-    for file in os.listdir(label_path):
-        if file.endswith(".json"):
-            json_file = os.path.join(label_path, file)
-            label_name = os.path.splitext(file)[0]
-            with open(json_file) as json_data:
-                label_dict = json.load(json_data)
-                # TODO: Validate label dict syntax
-                labels["io.simcore."+label_name] = json.dumps(label_dict)
-
-    tag = ''
-    if options.registry:
-        tag = options.registry + "/"
-
-    tag = tag + options.namespace + "/"
-    tag = tag + options.imagename
-    tag = tag + ":" + options.version
+    labels = read_labels(model_root_path)
+    tag = make_tag(options.registry, options.namespace, options.imagename, options.version)
 
     client = docker.from_env(version='auto')
   
@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+
+from simcore_sdk.dockerizer import batch
+
+
+def _service(root: Path, name: str, labels: str = '{"key": "value"}') -> Path:
+    path = root / name
+    (path / "labels").mkdir(parents=True)
+    (path / "labels" / "settings.json").write_text(labels)
+    (path / "Dockerfile").write_text("FROM scratch\n")
+    (path / "main.py").write_text("print('hello')\n")
+    return path
+
+
+def test_hash_context_without_dockerignore(tmp_path: Path):
+    path = _service(tmp_path, "service")
+    labels = batch.read_labels(str(path))
+
+    context_hash = batch.hash_context(str(path), "Dockerfile", labels)
+
+    assert context_hash == batch.hash_context(str(path), "Dockerfile", labels)
+    (path / "main.py").write_text("print('changed')\n")
+    assert context_hash != batch.hash_context(str(path), "Dockerfile", labels)
+
+
+def test_hash_context_skips_dockerignored_files(tmp_path: Path):
+    path = _service(tmp_path, "service")
+    (path / ".dockerignore").write_text("# comment\n*.log\n")
+    labels = batch.read_labels(str(path))
+    context_hash = batch.hash_context(str(path), "Dockerfile", labels)
+
+    (path / "build.log").write_text("not sent to docker")
+    assert context_hash == batch.hash_context(str(path), "Dockerfile", labels)
+    assert context_hash != batch.hash_context(
+        str(path), "Dockerfile", {"io.simcore.key": json.dumps("other")}
+    )
+
+
+def test_discover_services(tmp_path: Path):
+    _service(tmp_path, "a")
+    _service(tmp_path / "group", "b")
+    _service(tmp_path / "node_modules", "c")
+    # part of the build context of a
+    _service(tmp_path / "a", "nested")
+
+    assert [
+        Path(p).relative_to(tmp_path).as_posix()
+        for p in batch.discover_services(str(tmp_path))
+    ] == ["a", "group/b"]
+
+
+def test_invalid_service_does_not_abort_the_batch(tmp_path: Path, monkeypatch):
+    good = _service(tmp_path, "good")
+    bad = _service(tmp_path, "bad", labels="{invalid json")
+    built = []
+    monkeypatch.setattr(
+        batch, "build_service", lambda service, force: built.append(service.path)
+    )
+
+    failed = batch.run_batch(str(tmp_path), "registry:5000", "simcore", "1.0")
+
+    assert failed == [str(bad)]
+    assert built == [str(good)]